@@ -0,0 +1,413 @@
+import bisect
+import random
+import time
+import gc
+from itertools import accumulate
+from typing import List
+import pandas as pd
+
+pd.options.display.max_columns = None
+pd.options.display.max_rows = None
+pd.options.display.width = 1000
+
+
+class Leaf:
+    # 叶结点按 key 有序存放 key 与 value, 叶结点之间用 next 串成链表, 区间扫描不必回到内部结点
+    __slots__ = ('keys', 'values', 'next')
+
+    def __init__(self, keys: List, values: List, next=None) -> None:
+        self.keys = keys
+        self.values = values
+        self.next = next
+
+
+class Inner:
+    # children[i] 中的 key <= keys[i] <= children[i + 1] 中的 key, counts[i] 为 children[i] 中的 key 的个数
+    __slots__ = ('keys', 'children', 'counts')
+
+    def __init__(self, keys: List, children: List, counts: List[int]) -> None:
+        self.keys = keys
+        self.children = children
+        self.counts = counts
+
+
+class BPlusTree:
+    """B+ 树, 接口与 RedBlackTree 相同, 同时可以当作 key -> value 的有序映射使用, 允许重复的 key"""
+    root: object
+    fanout: int  # 内部结点最多的孩子数, 也是叶结点最多的 key 数
+    size: int
+
+    def __init__(self, fanout: int = 64) -> None:
+        if fanout < 4:
+            raise ValueError("'fanout' must be at least 4")
+        self.fanout = fanout
+        self.clear()
+
+    def clear(self):
+        self.root = Leaf([], [])
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    # 插入一条记录, 相同的 key 排在已有记录之后
+    def insert(self, key, value=None):
+        path = []
+        node = self.root
+        while type(node) is Inner:
+            i = bisect.bisect_right(node.keys, key)
+            node.counts[i] += 1
+            path.append((node, i))
+            node = node.children[i]
+        pos = bisect.bisect_right(node.keys, key)
+        node.keys.insert(pos, key)
+        node.values.insert(pos, value)
+        self.size += 1
+        if len(node.keys) > self.fanout:
+            self.split(node, path)
+
+    # 从叶结点开始向上分裂溢出的结点
+    def split(self, node, path):
+        while True:
+            half = len(node.keys) // 2
+            if type(node) is Leaf:
+                right = Leaf(node.keys[half:], node.values[half:], node.next)
+                del node.keys[half:]
+                del node.values[half:]
+                node.next = right
+                separator = right.keys[0]
+                left_count = len(node.keys)
+                right_count = len(right.keys)
+            else:
+                separator = node.keys[half]
+                right = Inner(node.keys[half + 1:], node.children[half + 1:], node.counts[half + 1:])
+                del node.keys[half:]
+                del node.children[half + 1:]
+                del node.counts[half + 1:]
+                left_count = sum(node.counts)
+                right_count = sum(right.counts)
+            if not path:
+                self.root = Inner([separator], [node, right], [left_count, right_count])
+                return
+            parent, i = path.pop()
+            parent.keys.insert(i, separator)
+            parent.children.insert(i + 1, right)
+            parent.counts[i] = left_count
+            parent.counts.insert(i + 1, right_count)
+            if len(parent.children) <= self.fanout:
+                return
+            node = parent
+
+    # 下降到第一个 key >= key 的记录, 返回 (路径, 叶结点, 位置), 位置可能等于叶结点的长度
+    def descend(self, key):
+        path = []
+        node = self.root
+        while type(node) is Inner:
+            i = bisect.bisect_left(node.keys, key)
+            path.append((node, i))
+            node = node.children[i]
+        return path, node, bisect.bisect_left(node.keys, key)
+
+    # 下降到中序第 index 条记录, 返回 (路径, 叶结点, 位置)
+    def descend_by_index(self, index: int):
+        path = []
+        node = self.root
+        while type(node) is Inner:
+            prefix = list(accumulate(node.counts))
+            i = bisect.bisect_right(prefix, index)
+            if i > 0:
+                index -= prefix[i - 1]
+            path.append((node, i))
+            node = node.children[i]
+        return path, node, index
+
+    # 删除一条 key 相等的记录, 不存在则不做任何事
+    def delete(self, key):
+        path, leaf, pos = self.descend(key)
+        if pos == len(leaf.keys):
+            # 第一个不小于 key 的记录在下一个叶结点, 回到还有右兄弟的祖先, 再沿最左路径下降
+            while path and path[-1][1] == len(path[-1][0].children) - 1:
+                path.pop()
+            if not path:
+                return
+            parent, i = path.pop()
+            path.append((parent, i + 1))
+            leaf = parent.children[i + 1]
+            while type(leaf) is Inner:
+                path.append((leaf, 0))
+                leaf = leaf.children[0]
+            pos = 0
+        if leaf.keys[pos] == key:
+            self.delete_at(path, leaf, pos)
+
+    def delete_by_index(self, index: int):
+        if index < 0 or index >= self.size:
+            return
+        self.delete_at(*self.descend_by_index(index))
+
+    def delete_at(self, path, leaf, pos):
+        del leaf.keys[pos]
+        del leaf.values[pos]
+        self.size -= 1
+        for parent, i in path:
+            parent.counts[i] -= 1
+        self.rebalance(leaf, path)
+
+    # 从叶结点开始向上处理不足半满的结点: 兄弟结点有富余时借一个, 否则与兄弟合并
+    def rebalance(self, node, path):
+        half = self.fanout // 2
+        while path:
+            if type(node) is Leaf:
+                if len(node.keys) >= half:
+                    return
+            elif len(node.children) >= half:
+                return
+            parent, i = path.pop()
+            if i > 0:
+                left, right, j = parent.children[i - 1], node, i - 1
+            else:
+                left, right, j = node, parent.children[i + 1], i
+            # left 与 right 是相邻的兄弟, parent.keys[j] 是它们之间的分隔 key
+            if type(node) is Leaf:
+                if len(left.keys) + len(right.keys) > self.fanout:
+                    if left is node:  # 从右兄弟借第一条
+                        left.keys.append(right.keys.pop(0))
+                        left.values.append(right.values.pop(0))
+                        moved = 1
+                    else:  # 从左兄弟借最后一条
+                        right.keys.insert(0, left.keys.pop())
+                        right.values.insert(0, left.values.pop())
+                        moved = -1
+                    parent.keys[j] = right.keys[0]
+                else:
+                    left.keys += right.keys
+                    left.values += right.values
+                    left.next = right.next
+                    moved = 0
+            else:
+                if len(left.children) + len(right.children) > self.fanout:
+                    if left is node:  # 经过父结点从右兄弟转来第一个孩子
+                        left.keys.append(parent.keys[j])
+                        parent.keys[j] = right.keys.pop(0)
+                        left.children.append(right.children.pop(0))
+                        moved = right.counts.pop(0)
+                        left.counts.append(moved)
+                    else:  # 经过父结点从左兄弟转来最后一个孩子
+                        right.keys.insert(0, parent.keys[j])
+                        parent.keys[j] = left.keys.pop()
+                        right.children.insert(0, left.children.pop())
+                        moved = -left.counts.pop()
+                        right.counts.insert(0, -moved)
+                else:
+                    left.keys.append(parent.keys[j])
+                    left.keys += right.keys
+                    left.children += right.children
+                    left.counts += right.counts
+                    moved = 0
+            if moved:
+                parent.counts[j] += moved
+                parent.counts[j + 1] -= moved
+                return
+            # 合并后去掉 right
+            parent.counts[j] += parent.counts[j + 1]
+            del parent.keys[j]
+            del parent.children[j + 1]
+            del parent.counts[j + 1]
+            node = parent
+        # 根只剩一个孩子时降低树高
+        if type(node) is Inner and len(node.children) == 1:
+            self.root = node.children[0]
+
+    # 中序第 index 个 key, 越界抛出 IndexError
+    def select(self, index: int):
+        if index < 0 or index >= self.size:
+            raise IndexError('index out of range')
+        _, leaf, pos = self.descend_by_index(index)
+        return leaf.keys[pos]
+
+    # 小于 key 的 key 的个数
+    def rank(self, key) -> int:
+        result = 0
+        node = self.root
+        while type(node) is Inner:
+            i = bisect.bisect_left(node.keys, key)
+            result += sum(node.counts[:i])
+            node = node.children[i]
+        return result + bisect.bisect_left(node.keys, key)
+
+    # key 相等的第一条记录的 value, 不存在抛出 KeyError
+    def __getitem__(self, key):
+        _, leaf, pos = self.descend(key)
+        if pos == len(leaf.keys):
+            leaf, pos = leaf.next, 0
+        if leaf is None or leaf.keys[pos] != key:
+            raise KeyError(key)
+        return leaf.values[pos]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    # key 存在时修改第一条记录的 value, 否则插入
+    def __setitem__(self, key, value):
+        _, leaf, pos = self.descend(key)
+        if pos == len(leaf.keys):
+            leaf, pos = leaf.next, 0
+        if leaf is not None and leaf.keys[pos] == key:
+            leaf.values[pos] = value
+        else:
+            self.insert(key, value)
+
+    def __delitem__(self, key):
+        size = self.size
+        self.delete(key)
+        if self.size == size:
+            raise KeyError(key)
+
+    # 按 key 的顺序惰性产生 [lo, hi) 内的 (key, value), 沿叶结点链表扫描, O(log(n) + k)
+    # 遍历过程中不能修改树
+    def items(self, lo=None, hi=None):
+        if lo is None:
+            leaf = self.root
+            while type(leaf) is Inner:
+                leaf = leaf.children[0]
+            pos = 0
+        else:
+            _, leaf, pos = self.descend(lo)
+        while leaf is not None:
+            keys = leaf.keys
+            end = len(keys) if hi is None else bisect.bisect_left(keys, hi, pos)
+            yield from zip(keys[pos:end], leaf.values[pos:end])
+            if end < len(keys):
+                return
+            leaf = leaf.next
+            pos = 0
+
+    def range(self, lo=None, hi=None):
+        for key, _ in self.items(lo, hi):
+            yield key
+
+    def __iter__(self):
+        return self.range()
+
+    # 如果正常则返回 (高度, key 的个数), 异常返回 None
+    def check_recursive(self, node, is_root: bool, low, high, leaves: List[Leaf]):
+        if type(node) is Leaf:
+            keys = node.keys
+            if len(keys) != len(node.values) or len(keys) > self.fanout:
+                return None
+            if not is_root and len(keys) < self.fanout // 2:
+                return None
+            if any(keys[i] > keys[i + 1] for i in range(len(keys) - 1)):
+                return None
+            if keys and (low is not None and keys[0] < low or high is not None and keys[-1] > high):
+                return None
+            leaves.append(node)
+            return 0, len(keys)
+        if len(node.keys) + 1 != len(node.children) or len(node.children) != len(node.counts):
+            return None
+        if len(node.children) > self.fanout or len(node.children) < (2 if is_root else self.fanout // 2):
+            return None
+        bounds = [low] + node.keys + [high]
+        height = None
+        for i, child in enumerate(node.children):
+            result = self.check_recursive(child, False, bounds[i], bounds[i + 1], leaves)
+            if result is None or result[1] != node.counts[i] or height not in (None, result[0]):
+                return None
+            height = result[0]
+        return height + 1, sum(node.counts)
+
+    # 检查 B+ 树的性质: 结点的填充度, 分隔 key, 计数, 所有叶结点同深, 叶结点链表
+    def check(self) -> bool:
+        leaves = []
+        result = self.check_recursive(self.root, True, None, None, leaves)
+        if result is None or result[1] != self.size:
+            return False
+        for i, leaf in enumerate(leaves):
+            if leaf.next is not (leaves[i + 1] if i + 1 < len(leaves) else None):
+                return False
+        return True
+
+
+if __name__ == '__main__':
+    print('===== 正确性测试 =====')
+    for fanout in (4, 5, 16):
+        tree = BPlusTree(fanout)
+        keys = []  # 有序的参照列表
+        for _ in range(5000):
+            operation = random.random()
+            if operation > 1 / 2 or not keys:
+                key = random.randint(0, 999)
+                print(f'\t> insert key = {key}')
+                tree.insert(key, -key)
+                bisect.insort(keys, key)
+            elif operation > 1 / 4:
+                index = random.randint(0, len(keys) - 1)
+                print(f'\t> delete index = {index}')
+                assert tree.select(index) == keys[index]
+                tree.delete_by_index(index)
+                keys.pop(index)
+            elif operation > 1 / 8:
+                key = random.randint(0, 999)
+                print(f'\t> delete key = {key}')
+                tree.delete(key)
+                index = bisect.bisect_left(keys, key)
+                if index < len(keys) and keys[index] == key:
+                    keys.pop(index)
+            else:
+                key = random.randint(0, 999)
+                print(f'\t> set key = {key}')
+                tree[key] = key
+                if key not in keys:
+                    bisect.insort(keys, key)
+                assert tree[key] == key and tree.get(key + 0.5) is None
+            assert tree.check()
+            lo = random.randint(0, 999)
+            assert list(tree.range(lo, lo + 100)) == keys[bisect.bisect_left(keys, lo):bisect.bisect_left(keys, lo + 100)]
+            assert tree.rank(lo) == bisect.bisect_left(keys, lo) and (lo in tree) == (lo in keys)
+        assert list(tree) == keys and len(tree) == len(keys)
+    print('===== 正确性测试通过 =====')
+    print()
+    print('===== 扇出测试 =====')
+    n = 2 ** 18
+    fanout_list = [8, 16, 32, 64, 128, 256]
+    time_cost = pd.DataFrame(
+        index=pd.Index(data=fanout_list, name='fanout'),
+        columns=pd.Index(['build cost', 'insert + delete cost', 'lookup cost', 'delete_by_index cost']),
+        dtype=float
+    )
+    gc.disable()
+    keys = [random.randint(0, 999) for _ in range(n)]
+    for fanout in fanout_list:
+        tree = BPlusTree(fanout)
+        start = time.time()
+        for key in keys:
+            tree.insert(key)
+        time_cost.loc[fanout, 'build cost'] = time.time() - start
+        start = time.time()
+        for key in keys[:10000]:
+            tree.insert(key)
+            tree.delete(key)
+        time_cost.loc[fanout, 'insert + delete cost'] = time.time() - start
+        start = time.time()
+        for key in keys[:10000]:
+            tree.get(key)
+        time_cost.loc[fanout, 'lookup cost'] = time.time() - start
+        start = time.time()
+        for _ in range(10000):
+            tree.delete_by_index(random.randint(0, len(tree) - 1))
+        time_cost.loc[fanout, 'delete_by_index cost'] = time.time() - start
+        assert tree.check()
+    print(time_cost)
+    gc.enable()
+    gc.collect()
+    print('===== 扇出测试结束 =====')
@@ -0,0 +1,126 @@
+import time
+from typing import Tuple
+import numpy as np
+from CSR_Matrix import CSR_Matrix
+
+
+# 对每一行做归约, 空行取 empty; reduceat 不能直接处理空行
+def row_reduce(ufunc: np.ufunc, matrix: CSR_Matrix, values: np.ndarray, empty) -> np.ndarray:
+    col_offset = np.asarray(matrix.col_offset)
+    vertex_num = len(col_offset) - 1
+    result = np.full(shape=vertex_num, fill_value=empty, dtype=values.dtype)
+    nonempty = np.flatnonzero(np.diff(col_offset))
+    if len(nonempty) != 0:
+        result[nonempty] = ufunc.reduceat(values, col_offset[nonempty])
+    return result
+
+
+# 每个顶的度数, 以及度数为 d 的顶的个数
+def degree_distribution(matrix: CSR_Matrix) -> Tuple[np.ndarray, np.ndarray]:
+    matrix.compact()
+    degree = np.diff(np.asarray(matrix.col_offset))
+    return degree, np.bincount(degree)
+
+
+# 标签传播求连通分量, 每个顶取邻点中最小的标签, 再做指针跳跃加速收敛
+# 返回每个顶所属分量的编号 (分量中最小的顶编号) 与分量个数
+def connected_components(matrix: CSR_Matrix) -> Tuple[np.ndarray, int]:
+    matrix.compact()
+    col = matrix.get_col()  # 压缩存储时为临时解码出的数组
+    vertex_num = len(matrix.col_offset) - 1
+    label = np.arange(vertex_num, dtype=np.int64)
+    while True:
+        new_label = np.minimum(label, row_reduce(np.minimum, matrix, label[col], vertex_num))
+        new_label = new_label[new_label]  # 指针跳跃
+        if (new_label == label).all():
+            break
+        label = new_label
+    return label, len(np.unique(label))
+
+
+# 三角形计数: 每条边按 (度数, 编号) 定向到较大的一端, 对每条定向边 (u, v) 求 N+(u) 与 N+(v) 的交,
+# 有序邻接表按行拼成全局有序的键 u * V + w, 交集用一次 searchsorted 批量完成
+def triangle_count(matrix: CSR_Matrix) -> int:
+    matrix.compact()
+    col_offset = np.asarray(matrix.col_offset)
+    vertex_num = len(col_offset) - 1
+    degree = np.diff(col_offset)
+    src = np.repeat(np.arange(vertex_num, dtype=np.int64), degree)
+    dst = matrix.get_col().astype(np.int64)
+    rank = np.empty(shape=vertex_num, dtype=np.int64)
+    rank[np.lexsort((np.arange(vertex_num), degree))] = np.arange(vertex_num)
+    forward = rank[src] < rank[dst]
+    src = src[forward]
+    dst = dst[forward]
+    # 定向后的 CSR, 行内仍按编号有序
+    out_offset = np.zeros(shape=vertex_num + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=vertex_num), out=out_offset[1:])
+    keys = src * vertex_num + dst
+    count = 0
+    chunk = 1 << 16  # 分块展开楔形, 控制内存
+    for begin in range(0, len(src), chunk):
+        u = src[begin:begin + chunk]
+        v = dst[begin:begin + chunk]
+        lens = out_offset[v + 1] - out_offset[v]
+        seg_begin = np.cumsum(lens) - lens
+        index = np.repeat(out_offset[v] - seg_begin, lens) + np.arange(int(lens.sum()), dtype=np.int64)
+        wedge = np.repeat(u, lens) * vertex_num + dst[index]
+        pos = np.searchsorted(keys, wedge)
+        pos[pos == len(keys)] = 0
+        count += int((keys[pos] == wedge).sum())
+    return count
+
+
+# 幂迭代求 PageRank, 每轮一次 SpMV (按行拉取邻点的贡献), 悬挂顶的质量均匀分配
+def pagerank(matrix: CSR_Matrix, damping: float = 0.85, tol: float = 1e-10, max_iter: int = 100) -> np.ndarray:
+    matrix.compact()
+    col = matrix.get_col()  # 压缩存储时为临时解码出的数组
+    vertex_num = len(matrix.col_offset) - 1
+    if vertex_num == 0:
+        return np.zeros(shape=0)
+    degree = np.diff(np.asarray(matrix.col_offset)).astype(np.float64)
+    dangling = degree == 0
+    rank = np.full(shape=vertex_num, fill_value=1 / vertex_num)
+    for _ in range(max_iter):
+        share = np.divide(rank, degree, out=np.zeros(shape=vertex_num), where=~dangling)
+        new_rank = damping * row_reduce(np.add, matrix, share[col], 0.0)
+        new_rank += (1 - damping + damping * rank[dangling].sum()) / vertex_num
+        if np.abs(new_rank - rank).sum() < tol:
+            return new_rank
+        rank = new_rank
+    return rank
+
+
+# 转为 scipy.sparse.csr_matrix, 共享 col_offset 与 col
+def to_scipy(matrix: CSR_Matrix):
+    from scipy.sparse import csr_matrix
+    matrix.compact()
+    vertex_num = len(matrix.col_offset) - 1
+    col = matrix.get_col()
+    data = np.ones(shape=len(col)) if matrix.weight is None else np.asarray(matrix.weight)
+    return csr_matrix((data, col, np.asarray(matrix.col_offset)), shape=(vertex_num, vertex_num))
+
+
+if __name__ == '__main__':
+    matrix = CSR_Matrix()
+    matrix.load_from_file('dataset/facebook_combined.txt')
+    start = time.time()
+    degree, histogram = degree_distribution(matrix)
+    print(f'degree distribution: max degree = {len(histogram) - 1}, time = {time.time() - start} s')
+    start = time.time()
+    label, component_num = connected_components(matrix)
+    print(f'connected components: {component_num}, time = {time.time() - start} s')
+    dist, _ = matrix.bfs_distances(matrix.vertexes[0])
+    if not ((label == 0) == (dist >= 0)).all():
+        print('error occurs in connected components!')
+    start = time.time()
+    triangles = triangle_count(matrix)
+    print(f'triangles: {triangles}, time = {time.time() - start} s')
+    # 用邻接表集合逐边求交验证
+    adj = [set(matrix.col[matrix.col_offset[u]:matrix.col_offset[u + 1]].tolist()) for u in range(len(degree))]
+    expected = sum(len(adj[u] & adj[v]) for u in range(len(degree)) for v in adj[u] if u < v) // 3
+    if triangles != expected:
+        print(f'error occurs in triangle count! expected {expected}')
+    start = time.time()
+    rank = pagerank(matrix)
+    print(f'pagerank: top vertex = {int(rank.argmax())}, sum = {rank.sum()}, time = {time.time() - start} s')
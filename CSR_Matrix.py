@@ -1,5 +1,15 @@
 import gc
-from typing import List
+import heapq
+import json
+import math
+import os
+import mmap
+import struct
+import warnings
+from array import array
+from collections import deque
+from itertools import accumulate, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 import numpy as np
 from enum import Enum, unique
 import time
@@ -67,175 +77,1125 @@ class Vertex:
         return str(self.id)
 
 
-class Edge:
-    pass
+# 二进制快照格式: 头部 + col_offset + col + labels, 每段按 8 字节对齐
+CSR_FILE_MAGIC = b'CSRM'
+CSR_FILE_VERSION = 2
+CSR_FILE_HEADER = struct.Struct('<4sIIIqq')  # magic, version, col 元素字节数, 标志位, 顶数, 边数
+CSR_FILE_WEIGHTED = 1  # 标志位: 带有边权数组 (版本 2 起)
+CSR_FILE_LABEL_ORDER = 2  # 标志位: 顶点经过重排, 带有 labels 的排序下标 (版本 2 起)
+
+
+def _align8(n: int) -> int:
+    return (n + 7) // 8 * 8
+
+
+class SearchStats:
+    """逐次记录 BFS 查询的统计信息 (出队顶数、扫描边数、每层前沿大小、双向搜索扩展的一侧与耗时),
+    并汇总为延迟分位数与直方图"""
+    queries: List[dict]
+
+    def __init__(self) -> None:
+        self.queries = []
+
+    def record(self, kind: str, start: int, end: int, seconds: float, path_length: int,
+               dequeued: int, edges_scanned: int, frontier_sizes: List[int], sides: Optional[List[int]] = None):
+        query = {
+            'kind': kind,
+            'start': start,
+            'end': end,
+            'time': seconds,
+            'path_length': path_length,
+            'dequeued': dequeued,
+            'edges_scanned': edges_scanned,
+            'frontier_sizes': frontier_sizes,
+        }
+        if sides is not None:
+            query['sides'] = sides  # 每层扩展的是哪一侧, 0 为起点一侧, 1 为终点一侧
+        self.queries.append(query)
+
+    def clear(self):
+        self.queries = []
+
+    # 按查询类型汇总: 次数、平均值、p50/p95/p99 延迟与以 2 为底的对数延迟直方图 (单位 us)
+    def summary(self) -> dict:
+        result = {}
+        for kind in sorted({q['kind'] for q in self.queries}):
+            queries = [q for q in self.queries if q['kind'] == kind]
+            times = np.array([q['time'] for q in queries])
+            p50, p95, p99 = np.percentile(times, [50, 95, 99])
+            buckets = np.floor(np.log2(np.maximum(times * 1e6, 1))).astype(np.int64)
+            result[kind] = {
+                'count': len(queries),
+                'mean': float(times.mean()),
+                'p50': float(p50),
+                'p95': float(p95),
+                'p99': float(p99),
+                'histogram_us': {f'<{2 ** (int(b) + 1)}': int(c) for b, c in zip(*np.unique(buckets, return_counts=True))},
+                'mean_dequeued': float(np.mean([q['dequeued'] for q in queries])),
+                'mean_edges_scanned': float(np.mean([q['edges_scanned'] for q in queries])),
+            }
+        return result
+
+    def to_json(self, path_to_file: Optional[str] = None, include_queries: bool = False) -> str:
+        data = {'summary': self.summary()}
+        if include_queries:
+            data['queries'] = self.queries
+        text = json.dumps(data, indent=2)
+        if path_to_file is not None:
+            with open(path_to_file, 'w') as f:
+                f.write(text)
+        return text
 
 
 class CSR_Matrix:
-    col_offset: List[int]
+    col_offset: np.ndarray
     vertexes: List[Vertex]  # 每个顶的信息
-    col: List[int]
-    edges: List[Edge]  # 每个边的信息
+    col: np.ndarray
+    weight: Optional[np.ndarray]  # 与 col 平行的边权, None 表示单位权
+    labels: np.ndarray  # 内部编号 -> 文件中的原始编号
+    label_order: Optional[np.ndarray]  # 重排后 labels 无序, 记录其排序下标用于反查, 未重排时为 None
+    # 每次查询的搜索状态, 用 epoch 标记是否访问过
+    search_epoch: int
+    search_mark: array
+    search_pre: array
+    search_depth: array
+    search_dist: array
+    # 双向 Dijkstra 反向一侧的搜索状态, 与正向共用 epoch
+    search_mark_r: array
+    search_pre_r: array
+    search_dist_r: array
+    # 地标索引, landmark_dist[v, i] 为第 i 个地标到 v 的跳数, 不可达为 -1
+    landmarks: np.ndarray
+    landmark_dist: np.ndarray
+    # 增量修改: 新增的邻点与被删除的压缩邻点 (墓碑), 累计到 compact_threshold 后合并回 CSR 数组
+    added: Dict[int, List[int]]
+    added_weight: Dict[int, List[float]]
+    removed: Dict[int, Set[int]]
+    delta_num: int
+    compact_threshold: int
+    stats: Optional[SearchStats]  # 为 None 时不做统计
+    # 压缩存储: 每行第一个邻点单独存放, 其余存相邻差值的 varint 编码; 压缩时 col 为空
+    compressed: Optional[bytes]
+    compressed_offset: np.ndarray  # 每行编码在 compressed 中的起始字节
+    compressed_first: np.ndarray  # 每行第一个邻点, 空行为 -1
+    compressed_simple: bytes  # 该行所有差值都只占一个字节
 
     def __init__(self) -> None:
-        self.col_offset = []
+        self.col_offset = np.zeros(shape=1, dtype=np.int64)
         self.vertexes = []
-        self.col = []
-        self.edges = []
+        self.col = np.zeros(shape=0, dtype=np.int32)
+        self.weight = None
+        self.labels = np.zeros(shape=0, dtype=np.int64)
+        self.label_order = None
+        self.search_epoch = 0
+        self.search_mark = array('q')
+        self.search_pre = array('q')
+        self.search_depth = array('q')
+        self.search_dist = array('d')
+        self.search_mark_r = array('q')
+        self.search_pre_r = array('q')
+        self.search_dist_r = array('d')
+        self.landmarks = np.zeros(shape=0, dtype=np.int64)
+        self.landmark_dist = np.zeros(shape=(0, 0), dtype=np.int32)
+        self.added = {}
+        self.added_weight = {}
+        self.removed = {}
+        self.delta_num = 0
+        self.compact_threshold = 4096
+        self.stats = None
+        self.compressed = None
+        self.compressed_offset = np.zeros(shape=1, dtype=np.int64)
+        self.compressed_first = np.zeros(shape=0, dtype=np.int64)
+        self.compressed_simple = b''
 
-    def load_from_file(self, path_to_file: str):
-        # 数据集已经预排序
+    # weighted 为 True 时读取第三列作为边权, reorder 见 reorder()
+    def load_from_file(self, path_to_file: str, chunk_lines: int = 1 << 20, weighted: bool = False,
+                       reorder: Optional[str] = None):
+        # 按块批量解析边表，不再构造 V*V 的邻接矩阵
+        columns = 3 if weighted else 2
+        chunks = []
         with open(path_to_file, 'r') as f:
-            pairs = f.readlines()
-            # 找出所有点
-            v = set()
-            for pair in pairs:
-                a, b = map(int, pair.split(sep=' '))
-                v.add(a)
-                v.add(b)
-            vertex_num = len(v)
-            edge_num = len(pairs) * 2
-            # 先表示成邻接矩阵
-            adj_matrix = np.zeros(shape=(vertex_num, vertex_num), dtype=bool)
-            for pair in pairs:
-                a, b = map(int, pair.split(sep=' '))
-                # 无向图
-                adj_matrix[a, b] = True
-                adj_matrix[b, a] = True
-            # 再压缩成 CSR 格式
-            self.col_offset = [-1 for _ in range(vertex_num)] + [edge_num]  # 最后一个元素作为哨兵，方便实现
-            self.vertexes = [Vertex(id) for id in sorted(v)]
-            self.col = [-1 for _ in range(edge_num)]
-            self.edges = [Edge() for _ in range(edge_num)]
-            edge_index = 0
-            for i in range(vertex_num):
-                self.col_offset[i] = edge_index  # 写入每行的列坐标的起始位置
-                for j in range(vertex_num):
-                    if adj_matrix[i, j]:
-                        self.col[edge_index] = j  # 写入列坐标
-                        edge_index += 1
-            assert edge_index == edge_num
+            while True:
+                lines = list(islice(f, chunk_lines))
+                if len(lines) == 0:
+                    break
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')  # 只含注释的块会触发空数据警告
+                    chunk = np.loadtxt(lines, dtype=np.float64 if weighted else np.int64, comments='#',
+                                       usecols=tuple(range(columns)), ndmin=2)
+                chunks.append(chunk)
+        data = np.concatenate(chunks) if len(chunks) != 0 else np.zeros(shape=(0, columns))
+        if weighted:
+            self.load_from_edge_array(data[:, :2].astype(np.int64), data[:, 2], reorder)
+        else:
+            self.load_from_edge_array(data, reorder=reorder)
+
+    # 从 (m, 2) 的边数组构造 CSR, 顶点编号可以稀疏、无序, weights 为可选的边权
+    def load_from_edge_array(self, edges: np.ndarray, weights: Optional[np.ndarray] = None,
+                             reorder: Optional[str] = None):
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64).reshape(-1)
+            if len(weights) != len(edges):
+                raise ValueError("'weights' must have one entry per edge")
+            if (weights < 0).any():
+                raise ValueError('edge weights must be non-negative')
+            weights = np.concatenate((weights, weights))
+        # 原始编号 -> 内部连续编号
+        labels, inverse = np.unique(edges, return_inverse=True)
+        inverse = inverse.reshape(-1, 2)
+        vertex_num = len(labels)
+        # 无向图, 两个方向都存
+        src = np.concatenate((inverse[:, 0], inverse[:, 1]))
+        dst = np.concatenate((inverse[:, 1], inverse[:, 0]))
+        del inverse
+        self.labels = labels
+        self.label_order = None
+        self.vertexes = [Vertex(id) for id in range(vertex_num)]
+        self.build(src, dst, vertex_num, weights)
+        if reorder is not None:
+            self.reorder(reorder)
         gc.collect()
 
+    # 重新编号, 使相邻的顶在内存中也相邻: 'rcm' 为 Reverse Cuthill-McKee, 'degree' 按度数降序,
+    # 'bfs' 为从每个分量中度数最大的顶出发的 BFS 序
+    def reorder(self, method: str):
+        self.compact()
+        if method == 'rcm':
+            order = self.cuthill_mckee_order(by_degree=True)[::-1]
+        elif method == 'bfs':
+            order = self.cuthill_mckee_order(by_degree=False)
+        elif method == 'degree':
+            order = np.argsort(-np.diff(np.asarray(self.col_offset)), kind='stable')
+        else:
+            raise ValueError(f"unknown reorder method '{method}'")
+        self.permute(np.ascontiguousarray(order, dtype=np.int64))
+
+    # 逐分量 BFS 得到的顶点序列; by_degree 为 True 时从度数最小的顶出发, 并按度数升序访问邻点
+    def cuthill_mckee_order(self, by_degree: bool) -> np.ndarray:
+        col_offset = np.asarray(self.col_offset)
+        vertex_num = len(col_offset) - 1
+        degree = np.diff(col_offset)
+        adj = self.get_adj_function()
+        degree_list = degree.tolist()
+        visited = bytearray(vertex_num)
+        order = []
+        starts = np.argsort(degree if by_degree else -degree, kind='stable').tolist()
+        for s in starts:
+            if visited[s]:
+                continue
+            visited[s] = 1
+            head = len(order)
+            order.append(s)
+            while head < len(order):
+                u = order[head]
+                head += 1
+                new = [v for v in adj(u) if not visited[v]]
+                if by_degree:
+                    new.sort(key=degree_list.__getitem__)
+                for v in new:
+                    visited[v] = 1
+                order.extend(new)
+        return np.array(order, dtype=np.int64)
+
+    # 按 order 重新编号, 新编号 i 对应原来的顶 order[i]
+    def permute(self, order: np.ndarray):
+        vertex_num = len(order)
+        new_id = np.empty(shape=vertex_num, dtype=np.int64)
+        new_id[order] = np.arange(vertex_num, dtype=np.int64)
+        col_offset = np.asarray(self.col_offset)
+        src = new_id[np.repeat(np.arange(vertex_num, dtype=np.int64), np.diff(col_offset))]
+        dst = new_id[self.get_col()]
+        self.labels = np.asarray(self.labels)[order]
+        self.label_order = np.argsort(self.labels, kind='stable')
+        self.vertexes = [Vertex(id) for id in range(vertex_num)]
+        compressed = self.compressed is not None
+        self.build(src, dst, vertex_num, None if self.weight is None else np.asarray(self.weight))
+        if compressed:  # 保持压缩存储
+            self.compress()
+
+    # 由内部编号表示的有向边 (src, dst) 构造 CSR 数组
+    def build(self, src: np.ndarray, dst: np.ndarray, vertex_num: int, weight: Optional[np.ndarray] = None):
+        # 行内按列坐标排序，并去掉重复边, 重复边保留权最小的一条
+        order = np.lexsort((dst, src)) if weight is None else np.lexsort((weight, dst, src))
+        src = src[order]
+        dst = dst[order]
+        if weight is not None:
+            weight = weight[order]
+        del order
+        if len(src) != 0:
+            keep = np.ones(shape=len(src), dtype=bool)
+            keep[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+            src = src[keep]
+            dst = dst[keep]
+            if weight is not None:
+                weight = weight[keep]
+        edge_num = len(dst)
+        # 计数得到每行的长度，前缀和即为行偏移，最后一个元素作为哨兵
+        self.col_offset = np.zeros(shape=vertex_num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=vertex_num), out=self.col_offset[1:])
+        self.col = dst.astype(np.int32 if vertex_num < 2 ** 31 else np.int64)
+        self.weight = weight
+        self.compressed = None
+        self.added = {}
+        self.added_weight = {}
+        self.removed = {}
+        self.delta_num = 0
+        self.landmarks = np.zeros(shape=0, dtype=np.int64)  # 旧的地标索引失效
+        self.landmark_dist = np.zeros(shape=(0, 0), dtype=np.int32)
+        assert self.col_offset[-1] == edge_num
+
+    # 保存为二进制快照, 之后可以用 open 直接映射
+    def save(self, path_to_file: str):
+        self.compact()
+        col_offset = np.ascontiguousarray(self.col_offset, dtype='<i8')
+        col = self.get_col()
+        col = np.ascontiguousarray(col, dtype='<i4' if col.itemsize == 4 else '<i8')
+        labels = np.ascontiguousarray(self.labels, dtype='<i8')
+        arrays = [col_offset, col, labels]
+        flags = 0
+        if self.weight is not None:
+            arrays.append(np.ascontiguousarray(self.weight, dtype='<f8'))
+            flags |= CSR_FILE_WEIGHTED
+        if self.label_order is not None:
+            arrays.append(np.ascontiguousarray(self.label_order, dtype='<i8'))
+            flags |= CSR_FILE_LABEL_ORDER
+        vertex_num = len(self.vertexes)
+        edge_num = len(col)
+        tmp_path = path_to_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(CSR_FILE_HEADER.pack(CSR_FILE_MAGIC, CSR_FILE_VERSION, col.itemsize, flags, vertex_num, edge_num))
+            for array in arrays:
+                f.write(b'\0' * (_align8(f.tell()) - f.tell()))
+                f.write(array.tobytes())
+        os.replace(tmp_path, path_to_file)  # 保证读者不会看到写了一半的文件
+
+    # 以只读 mmap 打开快照, 数组直接引用映射的页, 多个进程共享同一份物理内存
+    @classmethod
+    def open(cls, path_to_file: str) -> 'CSR_Matrix':
+        with open(path_to_file, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) < CSR_FILE_HEADER.size:
+            raise ValueError(f"'{path_to_file}' is not a CSR snapshot")
+        magic, version, col_itemsize, flags, vertex_num, edge_num = CSR_FILE_HEADER.unpack_from(mm, 0)
+        if magic != CSR_FILE_MAGIC:
+            raise ValueError(f"'{path_to_file}' is not a CSR snapshot")
+        if version not in (1, CSR_FILE_VERSION):
+            raise ValueError(f"unsupported CSR snapshot version {version}")
+        pos = _align8(CSR_FILE_HEADER.size)
+        col_offset = np.frombuffer(mm, dtype='<i8', count=vertex_num + 1, offset=pos)
+        pos = _align8(pos + col_offset.nbytes)
+        col = np.frombuffer(mm, dtype='<i4' if col_itemsize == 4 else '<i8', count=edge_num, offset=pos)
+        pos = _align8(pos + col.nbytes)
+        labels = np.frombuffer(mm, dtype='<i8', count=vertex_num, offset=pos)
+        matrix = cls()
+        pos = _align8(pos + labels.nbytes)
+        if version >= 2 and flags & CSR_FILE_WEIGHTED:
+            matrix.weight = np.frombuffer(mm, dtype='<f8', count=edge_num, offset=pos)
+            pos = _align8(pos + matrix.weight.nbytes)
+        if version >= 2 and flags & CSR_FILE_LABEL_ORDER:
+            matrix.label_order = np.frombuffer(mm, dtype='<i8', count=vertex_num, offset=pos)
+        matrix.col_offset = col_offset
+        matrix.col = col
+        matrix.labels = labels
+        matrix.vertexes = [Vertex(id) for id in range(vertex_num)]
+        return matrix
+
+    # 原始编号对应的顶
+    def get_vertex(self, label: int) -> Vertex:
+        if self.label_order is None:
+            i = int(np.searchsorted(self.labels, label))
+        else:
+            i = int(np.searchsorted(self.labels, label, sorter=self.label_order))
+            i = int(self.label_order[i]) if i < len(self.labels) else i
+        if i == len(self.labels) or self.labels[i] != label:
+            raise KeyError(label)
+        return self.vertexes[i]
+
     # 获得邻点
     def get_adj_vertexes(self, v: Vertex) -> List[Vertex]:
-        return [
-            self.vertexes[id]
-            for id in self.col[self.col_offset[v.id]:self.col_offset[v.id + 1]]
-        ]
+        return [self.vertexes[id] for id in self.get_adj_function()(v.id)]
+
+    # 返回由顶的内部编号取邻点编号的函数, 没有未合并的修改时直接切片 CSR 数组
+    def get_adj_function(self) -> Callable[[int], Iterable[int]]:
+        if self.compressed is not None:
+            row = self.get_decode_function()
+        else:
+            offset, col = self.get_adj_views()
+            row = lambda u: col[offset[u]:offset[u + 1]]
+        if self.delta_num == 0:
+            return row
+        added = self.added
+        removed = self.removed
+
+        def adj(u: int) -> Iterable[int]:
+            nbrs = row(u)
+            if u in removed:
+                dead = removed[u]
+                nbrs = [v for v in nbrs if v not in dead]
+            if u in added:
+                nbrs = list(nbrs) + added[u]
+            return nbrs
+
+        return adj
+
+    def has_edge(self, u: Vertex, v: Vertex) -> bool:
+        if v.id in self.added.get(u.id, ()):
+            return True
+        if v.id in self.removed.get(u.id, ()):
+            return False
+        if self.compressed is not None:
+            return v.id in self.get_decode_function()(u.id)
+        row = self.col[self.col_offset[u.id]:self.col_offset[u.id + 1]]
+        i = int(np.searchsorted(row, v.id))
+        return i < len(row) and row[i] == v.id
+
+    def add_edge(self, u: Vertex, v: Vertex, weight: float = 1.0):
+        if self.has_edge(u, v):
+            return
+        if weight < 0:
+            raise ValueError('edge weights must be non-negative')
+        if self.weight is None and weight != 1:  # 转为带权图
+            self.weight = np.ones(shape=int(self.col_offset[-1]), dtype=np.float64)
+        for a, b in ((u.id, v.id), (v.id, u.id)):
+            # 被删除的压缩边也记入 added, 墓碑保留, 这样新的权不会丢失
+            self.added.setdefault(a, []).append(b)
+            self.added_weight.setdefault(a, []).append(weight)
+            self.delta_num += 1
+            if a == b:  # 自环只存一次
+                break
+        self.modified()
+
+    def remove_edge(self, u: Vertex, v: Vertex):
+        if not self.has_edge(u, v):
+            return
+        for a, b in ((u.id, v.id), (v.id, u.id)):
+            if b in self.added.get(a, ()):
+                i = self.added[a].index(b)
+                del self.added[a][i]
+                del self.added_weight[a][i]
+                if len(self.added[a]) == 0:
+                    del self.added[a]
+                    del self.added_weight[a]
+                self.delta_num -= 1
+            else:
+                self.removed.setdefault(a, set()).add(b)
+                self.delta_num += 1
+            if a == b:
+                break
+        self.modified()
+
+    def modified(self):
+        self.landmarks = np.zeros(shape=0, dtype=np.int64)  # 地标距离不再可靠
+        self.landmark_dist = np.zeros(shape=(0, 0), dtype=np.int32)
+        if self.delta_num > self.compact_threshold:
+            self.compact()
+
+    # 把增量修改合并回 CSR 数组
+    # 压缩存储时临时解码出 col 合并, 合并后重新压缩, 不会留下解压后的数组
+    def compact(self):
+        if len(self.added) == 0 and len(self.removed) == 0:
+            return
+        compressed = self.compressed is not None
+        col_offset = np.asarray(self.col_offset)
+        vertex_num = len(col_offset) - 1
+        src = np.repeat(np.arange(vertex_num, dtype=np.int64), np.diff(col_offset))
+        dst = self.get_col().astype(np.int64)
+        keep = np.ones(shape=len(dst), dtype=bool)
+        for u, dead in self.removed.items():
+            row = dst[col_offset[u]:col_offset[u + 1]]
+            keep[col_offset[u] + np.searchsorted(row, np.fromiter(dead, dtype=np.int64))] = False
+        add_src = np.array([u for u, nbrs in self.added.items() for _ in nbrs], dtype=np.int64)
+        add_dst = np.array([v for nbrs in self.added.values() for v in nbrs], dtype=np.int64)
+        weight = None
+        if self.weight is not None:
+            add_weight = np.array([w for ws in self.added_weight.values() for w in ws], dtype=np.float64)
+            weight = np.concatenate((np.asarray(self.weight)[keep], add_weight))
+        self.build(np.concatenate((src[keep], add_src)), np.concatenate((dst[keep], add_dst)), vertex_num, weight)
+        if compressed:
+            self.compress()
+
+    # 把 col 压缩为差值 + varint 编码的字节串, 之后 BFS 类的遍历逐行按需解码;
+    # 向量化的实现通过 get_col() 临时解码出完整的 col, 不改变存储
+    def compress(self):
+        self.compact()
+        if self.compressed is not None:
+            return
+        col_offset = np.asarray(self.col_offset)
+        vertex_num = len(col_offset) - 1
+        col = np.asarray(self.col).astype(np.int64)
+        degree = np.diff(col_offset)
+        first = np.full(shape=vertex_num, fill_value=-1, dtype=np.int64)
+        nonempty = degree != 0
+        first[nonempty] = col[col_offset[:-1][nonempty]]
+        # 行首之外的元素存与前一个邻点的差, 行内有序且无重复, 差值为正
+        is_head = np.zeros(shape=len(col), dtype=bool)
+        is_head[col_offset[:-1][nonempty]] = True
+        gap = np.diff(col, prepend=0)[~is_head]
+        # 每个差值占 ceil(bit_length / 7) 个字节, 低 7 位在前, 最高位为续位标志
+        size = np.ones(shape=len(gap), dtype=np.int64)
+        for k in range(1, 10):
+            size += gap >= (1 << (7 * k))
+        start = np.cumsum(size) - size
+        buffer = np.zeros(shape=int(size.sum()), dtype=np.uint8)
+        for k in range(int(size.max()) if len(size) != 0 else 0):
+            has = size > k
+            byte = (gap[has] >> (7 * k)) & 0x7f
+            byte |= np.where(size[has] > k + 1, 0x80, 0)
+            buffer[start[has] + k] = byte
+        # 每行的字节范围, 行首不占字节
+        gap_row = np.repeat(np.arange(vertex_num), degree)[~is_head]
+        row_bytes = np.bincount(gap_row, weights=size, minlength=vertex_num).astype(np.int64)
+        row_multi = np.bincount(gap_row, weights=size > 1, minlength=vertex_num)
+        self.compressed_offset = np.zeros(shape=vertex_num + 1, dtype=np.int64)
+        np.cumsum(row_bytes, out=self.compressed_offset[1:])
+        self.compressed_first = first
+        self.compressed_simple = (row_multi == 0).astype(np.uint8).tobytes()
+        self.compressed = buffer.tobytes()
+        self.col = np.zeros(shape=0, dtype=self.col.dtype)
+
+    def decompress(self):
+        if self.compressed is None:
+            return
+        self.col = self.get_col()
+        self.compressed = None
+
+    # 完整的 col 数组, 压缩存储时解码出一份临时的数组
+    def get_col(self) -> np.ndarray:
+        if self.compressed is None:
+            return np.asarray(self.col)
+        decode = self.get_decode_function()
+        vertex_num = len(self.compressed_first)
+        return np.fromiter(
+            (v for u in range(vertex_num) for v in decode(u)),
+            dtype=np.int32 if vertex_num < 2 ** 31 else np.int64, count=int(self.col_offset[-1])
+        )
+
+    # 返回解码一行邻点的函数
+    def get_decode_function(self) -> Callable[[int], List[int]]:
+        buffer = self.compressed
+        offset = memoryview(self.compressed_offset)
+        first = memoryview(self.compressed_first)
+        simple = self.compressed_simple
+
+        def decode(u: int) -> List[int]:
+            v = first[u]
+            if v == -1:
+                return []
+            a = offset[u]
+            b = offset[u + 1]
+            if simple[u]:  # 全部是单字节差值, 直接累加
+                return list(accumulate(buffer[a:b], initial=v))
+            nbrs = [v]
+            x = 0
+            shift = 0
+            for byte in buffer[a:b]:
+                x |= (byte & 0x7f) << shift
+                if byte & 0x80:
+                    shift += 7
+                else:
+                    v += x
+                    nbrs.append(v)
+                    x = 0
+                    shift = 0
+            return nbrs
+
+        return decode
+
+    # 压缩后占用的字节数, 包括每行的偏移与行首
+    def compressed_nbytes(self) -> int:
+        return len(self.compressed) + self.compressed_offset.nbytes + self.compressed_first.nbytes + \
+            len(self.compressed_simple)
+
+    # 以 memoryview 访问 CSR 数组, 下标取值直接得到 int, 比逐个取 numpy 标量快
+    def get_adj_views(self) -> Tuple[memoryview, memoryview]:
+        return memoryview(self.col_offset), memoryview(self.col)
+
+    # 开始一次新的查询, 访问标记不等于当前 epoch 的顶即视为未访问, 无需 O(V) 重置
+    def next_epoch(self, step: int = 1) -> int:
+        vertex_num = len(self.vertexes)
+        if len(self.search_mark) != vertex_num:
+            self.search_mark = array('q', bytes(8 * vertex_num))
+            self.search_pre = array('q', bytes(8 * vertex_num))
+            self.search_depth = array('q', bytes(8 * vertex_num))
+            self.search_dist = array('d', bytes(8 * vertex_num))
+            self.search_mark_r = array('q', bytes(8 * vertex_num))
+            self.search_pre_r = array('q', bytes(8 * vertex_num))
+            self.search_dist_r = array('d', bytes(8 * vertex_num))
+            self.search_epoch = 0
+        self.search_epoch += step
+        return self.search_epoch
+
+    # 由前驱数组回溯出 v 到搜索起点的链, 顺序为 v -> 起点
+    def trace(self, v: int, pre: Optional[array] = None) -> List[int]:
+        if pre is None:
+            pre = self.search_pre
+        chain = []
+        while v != -1:
+            chain.append(v)
+            v = pre[v]
+        return chain
+
+    # 开启逐次查询的统计
+    def enable_stats(self) -> SearchStats:
+        if self.stats is None:
+            self.stats = SearchStats()
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
 
     def BFS(self, start: Vertex, end: Vertex) -> List[Vertex]:
-        if start is end:  # 开始与结束重合的特殊情况
+        if start is end:  # 开始与结束重合的特殊情况, 也要计入统计
+            if self.stats is not None:
+                self.stats.record('BFS', start.id, end.id, 0.0, 0, 0, 0, [])
             return [start]
-        for v in self.vertexes:
-            v.color = Color.WHITE  # 标注为未访问
-            v.pre = None
-        s = start
-        s.color = Color.GRAY
-        s.depth = 0
-        s.pre = None
-        P = [s]  # P 为下次迭代要访问的顶
+        stats = self.stats
+        if stats is not None:
+            begin = time.perf_counter()
+            dequeued = 0
+            scanned = 0
+            frontier_sizes = []
+            level = -1
+        adj = self.get_adj_function()
+        epoch = self.next_epoch()
+        mark = self.search_mark
+        pre = self.search_pre
+        depth = self.search_depth
+        s = start.id
+        t = end.id
+        mark[s] = epoch  # 标注为已访问
+        pre[s] = -1
+        depth[s] = 0
+        P = deque([s])  # P 为下次迭代要访问的顶
         success = False
         while len(P) != 0:
-            s = P.pop(0)
-            for v in self.get_adj_vertexes(s):
-                if v is end:  # 成功找到 end
-                    v.pre = s
-                    success = True
-                    break
-                elif v.color == Color.WHITE:  # 未访问的顶标记为即将访问
-                    v.color = Color.GRAY
-                    v.depth = s.depth + 1  # 记录深度
-                    v.pre = s  # 记录前驱
+            u = P.popleft()
+            nbrs = adj(u)
+            if stats is not None:
+                dequeued += 1
+                scanned += len(nbrs)
+                if depth[u] != level:  # 进入新的一层
+                    level = depth[u]
+                    frontier_sizes.append(0)
+                frontier_sizes[-1] += 1
+            for v in nbrs:
+                if mark[v] != epoch:  # 未访问的顶标记为即将访问
+                    mark[v] = epoch
+                    pre[v] = u  # 记录前驱
+                    depth[v] = depth[u] + 1  # 记录深度
+                    if v == t:  # 成功找到 end
+                        success = True
+                        break
                     P.append(v)
-            s.color = Color.BLACK  # 标记为访问过
             if success:
                 break
         # 构建最短路径
         if success:
-            chain = []
-            s = end
-            while s is not None:
-                chain.append(s)
-                s = s.pre
+            chain = self.trace(t)
             chain.reverse()
-            return chain
+            path = [self.vertexes[v] for v in chain]
         else:
-            return []
+            path = []
+        if stats is not None:
+            stats.record('BFS', s, t, time.perf_counter() - begin, len(path) - 1,
+                         dequeued, scanned, frontier_sizes)
+        return path
 
+    # 双向 BFS, 每次扩展前沿较小一侧的一整层
     def BFS_bidirectional(self, start: Vertex, end: Vertex) -> List[Vertex]:
         if start is end:
+            if self.stats is not None:
+                self.stats.record('BFS_bidirectional', start.id, end.id, 0.0, 0, 0, 0, [], [])
             return [start]
-        for v in self.vertexes:
-            v.color = Color.WHITE
-            v.pre = None
-        s = start
-        s.color = Color.GRAY1
-        s.depth = 0
-        s.pre = None
-        P = [s]
-        t = end
-        t.color = Color.GRAY2
-        t.depth = 0
-        t.pre = None
-        Q = [t]
-        bridge1 = None  # 两侧搜索的连通顶
-        bridge2 = None
-        success = False
-        while len(P) != 0 or len(Q) != 0:
-            # 先进行一侧的搜索
-            for _ in range(len(P)):
-                s = P.pop(0)
-                for v in self.get_adj_vertexes(s):
-                    if v.color == Color.GRAY2:  # v 为另一侧即将访问的点
-                        bridge1 = s
-                        bridge2 = v
-                        success = True
-                        break
-                    elif v.color == Color.WHITE:
-                        v.color = Color.GRAY1
-                        v.depth = s.depth + 1
-                        v.pre = s
-                        P.append(v)
-                s.color = Color.BLACK1
-                if success:
-                    break
-            if success:
-                break
-            # 再进行另一侧的搜索
-            for _ in range(len(Q)):
-                t = Q.pop(0)
-                for v in self.get_adj_vertexes(t):
-                    if v.color == Color.GRAY1:
-                        bridge1 = v
-                        bridge2 = t
-                        success = True
+        stats = self.stats
+        if stats is not None:
+            begin = time.perf_counter()
+            dequeued = 0
+            scanned = 0
+            frontier_sizes = []
+            sides = []
+        adj = self.get_adj_function()
+        # 两侧使用相邻的两个 epoch 作为标记
+        epoch2 = self.next_epoch(2)
+        epoch1 = epoch2 - 1
+        epochs = (epoch1, epoch2)
+        mark = self.search_mark
+        pre = self.search_pre
+        depth = self.search_depth
+        s = start.id
+        t = end.id
+        for v, epoch in ((s, epoch1), (t, epoch2)):
+            mark[v] = epoch
+            pre[v] = -1
+            depth[v] = 0
+        frontiers = [[s], [t]]
+        bridge1 = -1  # 两侧搜索的连通顶
+        bridge2 = -1
+        while len(frontiers[0]) != 0 and len(frontiers[1]) != 0:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            mine = epochs[side]
+            theirs = epochs[1 - side]
+            if stats is not None:
+                frontier_sizes.append(len(frontiers[side]))
+                sides.append(side)
+            next_frontier = []
+            for u in frontiers[side]:
+                nbrs = adj(u)
+                if stats is not None:
+                    dequeued += 1
+                    scanned += len(nbrs)
+                for v in nbrs:
+                    m = mark[v]
+                    if m == theirs:  # v 已被另一侧访问
+                        bridge1, bridge2 = (u, v) if side == 0 else (v, u)
                         break
-                    elif v.color == Color.WHITE:
-                        v.color = Color.GRAY2
-                        v.depth = t.depth + 1
-                        v.pre = t
-                        Q.append(v)
-                t.color = Color.BLACK2
-                if success:
+                    elif m != mine:
+                        mark[v] = mine
+                        pre[v] = u
+                        depth[v] = depth[u] + 1
+                        next_frontier.append(v)
+                if bridge1 != -1:
                     break
-            if success:
+            if bridge1 != -1:
                 break
-        if success:
-            chain1 = []
-            while bridge1 is not None:
-                chain1.append(bridge1)
-                bridge1 = bridge1.pre
-            chain2 = []
-            while bridge2 is not None:
-                chain2.append(bridge2)
-                bridge2 = bridge2.pre
-            assert chain1[len(chain1) - 1] is start
-            assert chain2[len(chain2) - 1] is end
+            frontiers[side] = next_frontier
+        if bridge1 != -1:
+            chain1 = self.trace(bridge1)
+            chain2 = self.trace(bridge2)
+            assert chain1[len(chain1) - 1] == s
+            assert chain2[len(chain2) - 1] == t
             chain1.reverse()
-            return chain1 + chain2
+            path = [self.vertexes[v] for v in chain1 + chain2]
+        else:
+            path = []
+        if stats is not None:
+            stats.record('BFS_bidirectional', s, t, time.perf_counter() - begin, len(path) - 1,
+                         dequeued, scanned, frontier_sizes, sides)
+        return path
+
+    # 双向 BFS 构造最短路 DAG: 返回相遇层上的全部桥边 (起点一侧的顶, 终点一侧的顶),
+    # 以及两侧各自的深度与最短路条数; 状态放在字典里, 不受之后查询的影响
+    def shortest_path_dag(self, s: int, t: int) -> Tuple[List[Tuple[int, int]], Tuple[dict, dict], Tuple[dict, dict]]:
+        adj = self.get_adj_function()
+        depths = ({s: 0}, {t: 0})
+        sigmas = ({s: 1}, {t: 1})
+        frontiers = [[s], [t]]
+        levels = [0, 0]
+        while len(frontiers[0]) != 0 and len(frontiers[1]) != 0:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            mine = depths[side]
+            theirs = depths[1 - side]
+            sigma = sigmas[side]
+            d = levels[side] + 1
+            bridges = []
+            next_frontier = []
+            # 相遇时也要扫完整层, 才能找到全部桥边
+            for u in frontiers[side]:
+                count = sigma[u]
+                for v in adj(u):
+                    if v in theirs:
+                        bridges.append((u, v) if side == 0 else (v, u))
+                        continue
+                    dv = mine.get(v)
+                    if dv is None:
+                        mine[v] = d
+                        sigma[v] = count
+                        next_frontier.append(v)
+                    elif dv == d:
+                        sigma[v] += count
+            if len(bridges) != 0:
+                return bridges, depths, sigmas
+            levels[side] = d
+            frontiers[side] = next_frontier
+        return [], depths, sigmas
+
+    # 最短路的条数, 不可达时为 0
+    def count_shortest_paths(self, start: Vertex, end: Vertex) -> int:
+        if start is end:
+            return 1
+        bridges, _, sigmas = self.shortest_path_dag(start.id, end.id)
+        return sum(sigmas[0][u] * sigmas[1][v] for u, v in bridges)
+
+    # 惰性地逐条产生所有最短路
+    def all_shortest_paths(self, start: Vertex, end: Vertex) -> Iterator[List[Vertex]]:
+        if start is end:
+            yield [start]
+            return
+        bridges, depths, _ = self.shortest_path_dag(start.id, end.id)
+        adj = self.get_adj_function()
+        for u, v in bridges:
+            for chain1 in self.dag_paths(adj, depths[0], u):
+                for chain2 in self.dag_paths(adj, depths[1], v):
+                    chain2.reverse()
+                    yield [self.vertexes[w] for w in chain1 + chain2]
+
+    # 在最短路 DAG 中沿深度递减的方向回溯, 产生从搜索起点到 v 的所有路径
+    def dag_paths(self, adj: Callable[[int], Iterable[int]], depth: dict, v: int) -> Iterator[List[int]]:
+        d = depth[v]
+        if d == 0:
+            yield [v]
+            return
+        for w in adj(v):
+            if depth.get(w) == d - 1:
+                for chain in self.dag_paths(adj, depth, w):
+                    chain.append(v)
+                    yield chain
+
+    # 单源 Dijkstra, 二叉堆 + 惰性删除, 返回 (距离, 路径), 不可达时为 (inf, [])
+    def dijkstra(self, start: Vertex, end: Vertex) -> Tuple[float, List[Vertex]]:
+        if self.weight is None:  # 单位权退化为 BFS
+            path = self.BFS(start, end)
+            return (len(path) - 1 if len(path) != 0 else math.inf), path
+        self.compact()
+        offset = memoryview(self.col_offset)
+        adj = self.get_adj_function()
+        weight = memoryview(self.weight)
+        epoch = self.next_epoch()
+        mark = self.search_mark
+        pre = self.search_pre
+        dist = self.search_dist
+        s = start.id
+        t = end.id
+        mark[s] = epoch
+        pre[s] = -1
+        dist[s] = 0.0
+        heap = [(0.0, s)]
+        while len(heap) != 0:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:  # 过期的堆元素
+                continue
+            if u == t:
+                chain = self.trace(t)
+                chain.reverse()
+                return d, [self.vertexes[v] for v in chain]
+            for i, v in enumerate(adj(u), offset[u]):
+                nd = d + weight[i]
+                if mark[v] != epoch or nd < dist[v]:
+                    mark[v] = epoch
+                    pre[v] = u
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return math.inf, []
+
+    # 双向 Dijkstra, 每次从堆顶较小的一侧扩展, 两侧堆顶之和不小于当前最优值时停止
+    def dijkstra_bidirectional(self, start: Vertex, end: Vertex) -> Tuple[float, List[Vertex]]:
+        if self.weight is None:
+            path = self.BFS_bidirectional(start, end)
+            return (len(path) - 1 if len(path) != 0 else math.inf), path
+        if start is end:
+            return 0.0, [start]
+        self.compact()
+        offset = memoryview(self.col_offset)
+        adj = self.get_adj_function()
+        weight = memoryview(self.weight)
+        epoch = self.next_epoch()
+        marks = (self.search_mark, self.search_mark_r)
+        pres = (self.search_pre, self.search_pre_r)
+        dists = (self.search_dist, self.search_dist_r)
+        heaps = ([(0.0, start.id)], [(0.0, end.id)])
+        for side, v in ((0, start.id), (1, end.id)):
+            marks[side][v] = epoch
+            pres[side][v] = -1
+            dists[side][v] = 0.0
+        best = math.inf
+        bridge = -1  # 最优路径上两侧都到达的顶
+        while len(heaps[0]) != 0 and len(heaps[1]) != 0:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            mark, pre, dist, heap = marks[side], pres[side], dists[side], heaps[side]
+            other_mark, other_dist = marks[1 - side], dists[1 - side]
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for i, v in enumerate(adj(u), offset[u]):
+                nd = d + weight[i]
+                if mark[v] != epoch or nd < dist[v]:
+                    mark[v] = epoch
+                    pre[v] = u
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+                    if other_mark[v] == epoch and nd + other_dist[v] < best:
+                        best = nd + other_dist[v]
+                        bridge = v
+        if bridge == -1:
+            return math.inf, []
+        chain1 = self.trace(bridge, self.search_pre)
+        chain2 = self.trace(bridge, self.search_pre_r)
+        chain1.reverse()
+        return best, [self.vertexes[v] for v in chain1 + chain2[1:]]
+
+    # 一次性取出一组顶的全部邻边, 返回 (所属顶, 邻点) 两个等长数组
+    # col 为 get_col() 的结果, 不传时压缩存储只逐行解码用到的行
+    def gather_adj(self, ids: np.ndarray, col: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        owner, index = self.gather_adj_index(ids)
+        if col is None and self.compressed is not None:
+            decode = self.get_decode_function()
+            nbr = np.fromiter((v for u in ids.tolist() for v in decode(u)), dtype=np.int64, count=len(index))
+            return owner, nbr
+        if col is None:
+            col = self.col
+        return owner, np.asarray(col)[index].astype(np.int64)
+
+    # 同 gather_adj, 但返回邻边在 col 中的下标, 便于同时取出边权
+    def gather_adj_index(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        col_offset = np.asarray(self.col_offset)
+        starts = col_offset[ids]
+        lens = col_offset[ids + 1] - starts
+        total = int(lens.sum())
+        # 每段的起点减去该段在结果中的起始位置, 展开后加上 arange 即为 col 中的下标
+        seg_begin = np.cumsum(lens) - lens
+        index = np.repeat(starts - seg_begin, lens) + np.arange(total, dtype=np.int64)
+        return np.repeat(ids, lens), index
+
+    # v 的 k 跳以内的顶 (含 v 本身) 的布尔掩码
+    def k_hop_mask(self, v: Vertex, k: int) -> np.ndarray:
+        self.compact()
+        visited = np.zeros(shape=len(self.vertexes), dtype=bool)
+        visited[v.id] = True
+        frontier = np.array([v.id], dtype=np.int64)
+        for _ in range(k):
+            if len(frontier) == 0:
+                break
+            _, nbr = self.gather_adj(frontier)
+            frontier = np.unique(nbr[~visited[nbr]])
+            visited[frontier] = True
+        return visited
+
+    # 距离 v 为 1..k 跳的顶的编号, 不创建 Vertex 对象
+    def k_hop(self, v: Vertex, k: int) -> np.ndarray:
+        mask = self.k_hop_mask(v, k)
+        mask[v.id] = False
+        return np.flatnonzero(mask)
+
+    # 同时在 u 与 v 的 k 跳以内的顶 (不含 u, v 本身)
+    def common_k_hop(self, u: Vertex, v: Vertex, k: int) -> np.ndarray:
+        mask = self.k_hop_mask(u, k) & self.k_hop_mask(v, k)
+        mask[u.id] = False
+        mask[v.id] = False
+        return np.flatnonzero(mask)
+
+    # 以 v 为中心、k 跳以内的顶的导出子图, 保留原始编号与边权
+    def ego_network(self, v: Vertex, k: int = 1) -> 'CSR_Matrix':
+        ids = np.flatnonzero(self.k_hop_mask(v, k))
+        new_id = np.full(shape=len(self.vertexes), fill_value=-1, dtype=np.int64)
+        new_id[ids] = np.arange(len(ids), dtype=np.int64)
+        _, index = self.gather_adj_index(ids)
+        owner, nbr = self.gather_adj(ids)
+        inside = new_id[nbr] != -1
+        sub = CSR_Matrix()
+        sub.labels = np.asarray(self.labels)[ids]
+        if self.label_order is not None:
+            sub.label_order = np.argsort(sub.labels, kind='stable')
+        sub.vertexes = [Vertex(id) for id in range(len(ids))]
+        weight = None if self.weight is None else np.asarray(self.weight)[index[inside]]
+        sub.build(new_id[owner[inside]], new_id[nbr[inside]], len(ids), weight)
+        return sub
+
+    # 单源全图 BFS, 前沿较大时改为自底向上 (由未访问的顶寻找前沿中的邻点)
+    # 返回每个顶的跳数 (不可达为 -1) 和前驱 (起点与不可达为 -1)
+    def bfs_distances(self, source: Vertex, alpha: float = 14, beta: float = 24) -> Tuple[np.ndarray, np.ndarray]:
+        self.compact()  # 向量化的实现只读取 CSR 数组
+        col = self.get_col()
+        vertex_num = len(self.vertexes)
+        degree = np.diff(np.asarray(self.col_offset))
+        dist = np.full(shape=vertex_num, fill_value=-1, dtype=np.int64)
+        parent = np.full(shape=vertex_num, fill_value=-1, dtype=np.int64)
+        frontier = np.zeros(shape=vertex_num, dtype=bool)
+        frontier[source.id] = True
+        dist[source.id] = 0
+        unvisited_edges = int(degree.sum()) - int(degree[source.id])
+        bottom_up = False
+        level = 0
+        while frontier.any():
+            level += 1
+            frontier_ids = np.flatnonzero(frontier)
+            frontier_edges = int(degree[frontier_ids].sum())
+            # 启发式切换方向
+            if not bottom_up and frontier_edges > unvisited_edges / alpha:
+                bottom_up = True
+            elif bottom_up and len(frontier_ids) < vertex_num / beta:
+                bottom_up = False
+            next_frontier = np.zeros(shape=vertex_num, dtype=bool)
+            if bottom_up:
+                unvisited = np.flatnonzero(dist == -1)
+                owner, nbr = self.gather_adj(unvisited, col)
+                hit = frontier[nbr]
+                owner = owner[hit]
+                nbr = nbr[hit]
+                # 每个未访问的顶取第一个位于前沿的邻点作为前驱
+                new, first = np.unique(owner, return_index=True)
+                parent[new] = nbr[first]
+            else:
+                owner, nbr = self.gather_adj(frontier_ids, col)
+                hit = dist[nbr] == -1
+                owner = owner[hit]
+                nbr = nbr[hit]
+                new, first = np.unique(nbr, return_index=True)
+                parent[new] = owner[first]
+            dist[new] = level
+            next_frontier[new] = True
+            unvisited_edges -= int(degree[new].sum())
+            frontier = next_frontier
+        return dist, parent
+
+    # 批量回答 (start, end) 最短路查询, 每 64 个不同起点打包进一个 uint64 位向量, 同时扩展
+    # 返回每对的跳数 (不可达为 -1), with_paths 为 True 时同时返回路径
+    def batch_shortest_paths(self, pairs: Iterable[Tuple[Vertex, Vertex]], with_paths: bool = False):
+        self.compact()
+        pairs = [(s.id, t.id) for s, t in pairs]
+        dist = np.full(shape=len(pairs), fill_value=-1, dtype=np.int64)
+        paths = [[] for _ in pairs]
+        # 相同起点的查询共用同一位
+        by_source = {}
+        for i, (s, t) in enumerate(pairs):
+            by_source.setdefault(s, []).append(i)
+        sources = list(by_source.keys())
+        vertex_num = len(self.vertexes)
+        col_offset = np.asarray(self.col_offset)
+        col = self.get_col()
+        nonempty = np.flatnonzero(np.diff(col_offset))  # 空行不能参与 reduceat
+        nonempty_offset = col_offset[nonempty]
+        for batch_start in range(0, len(sources), 64):
+            batch = sources[batch_start:batch_start + 64]
+            query = [(i, bit, pairs[i][1]) for bit, s in enumerate(batch) for i in by_source[s]]
+            query_index = np.array([i for i, _, _ in query], dtype=np.int64)
+            query_bit = np.array([bit for _, bit, _ in query], dtype=np.uint64)
+            query_target = np.array([t for _, _, t in query], dtype=np.int64)
+            frontier = np.zeros(shape=vertex_num, dtype=np.uint64)
+            for bit, s in enumerate(batch):
+                frontier[s] |= np.uint64(1) << np.uint64(bit)
+            seen = frontier.copy()
+            levels = [frontier]  # 每层新访问到的位, 用于回溯路径
+            # 起点即终点
+            found = ((seen[query_target] >> query_bit) & np.uint64(1)).astype(bool)
+            dist[query_index[found]] = 0
+            level = 0
+            while not found.all() and frontier.any():
+                level += 1
+                # 每个顶收集其所有邻点的前沿位
+                reached = np.zeros(shape=vertex_num, dtype=np.uint64)
+                if len(nonempty) != 0:
+                    reached[nonempty] = np.bitwise_or.reduceat(frontier[col], nonempty_offset)
+                frontier = reached & ~seen
+                seen |= frontier
+                levels.append(frontier)
+                hit = ~found & ((frontier[query_target] >> query_bit) & np.uint64(1)).astype(bool)
+                dist[query_index[hit]] = level
+                found |= hit
+            if with_paths:
+                for i, bit, t in query:
+                    if dist[i] >= 0:
+                        paths[i] = [self.vertexes[v] for v in self.trace_levels(levels, bit, t, int(dist[i]))]
+        if with_paths:
+            return dist, paths
+        return dist
+
+    # 沿着逐层位向量从 t 回溯到起点
+    def trace_levels(self, levels: List[np.ndarray], bit: int, t: int, d: int) -> List[int]:
+        adj = self.get_adj_function()
+        chain = [t]
+        for level in range(d - 1, -1, -1):
+            frontier = levels[level]
+            for v in adj(t):
+                if (int(frontier[v]) >> bit) & 1:
+                    t = v
+                    break
+            chain.append(t)
+        chain.reverse()
+        return chain
+
+    # 选取 k 个地标 (度数最大或随机) 并预先计算它们到所有顶的距离
+    def build_landmarks(self, k: int = 16, strategy: str = 'degree'):
+        vertex_num = len(self.vertexes)
+        k = min(k, vertex_num)
+        if k <= 0:
+            raise ValueError("'k' must be positive")
+        if strategy == 'degree':
+            degree = np.diff(np.asarray(self.col_offset))
+            landmarks = np.argsort(-degree, kind='stable')[:k]
+        elif strategy == 'random':
+            landmarks = np.array(random.sample(range(vertex_num), k), dtype=np.int64)
         else:
-            return []
+            raise ValueError(f"unknown landmark strategy '{strategy}'")
+        landmark_dist = np.empty(shape=(vertex_num, k), dtype=np.int32)
+        for i, l in enumerate(landmarks):
+            landmark_dist[:, i], _ = self.bfs_distances(self.vertexes[l])
+        self.landmarks = landmarks.astype(np.int64)
+        self.landmark_dist = landmark_dist
+
+    # 由三角不等式得到一组顶到 t 的距离下界, 已知不连通的为 inf
+    def landmark_lower_bound(self, ids: np.ndarray, t: int) -> np.ndarray:
+        a = self.landmark_dist[ids]
+        b = self.landmark_dist[t]
+        both = (a >= 0) & (b >= 0)
+        lower = np.where(both, np.abs(a - b), 0).max(axis=1).astype(float)
+        lower[((a >= 0) != (b >= 0)).any(axis=1)] = math.inf  # 某个地标只能到达其中之一
+        return lower
+
+    # 利用地标估计 u, v 间的距离, 返回 (下界, 上界), 不可达时为 inf
+    def estimate_distance(self, u: Vertex, v: Vertex) -> Tuple[float, float]:
+        if len(self.landmarks) == 0:
+            raise RuntimeError('landmark index has not been built')
+        if u is v:
+            return 0, 0
+        lower = max(float(self.landmark_lower_bound(np.array([u.id]), v.id)[0]), 1)
+        a = self.landmark_dist[u.id]
+        b = self.landmark_dist[v.id]
+        both = (a >= 0) & (b >= 0)
+        upper = float((a[both] + b[both]).min()) if both.any() else math.inf
+        if lower == math.inf:
+            upper = math.inf
+        return lower, upper
+
+    # 精确跳数 (不可达为 -1), 用地标的上界截断逐层双向搜索: 两侧深度之和加一达到上界后
+    # 再扩展也找不到更短的路, 最后一层只检查是否与另一侧相遇, 不再构造新的前沿
+    # 逐顶按地标下界剪枝在 Python 中比多扫的边更慢, 因此只用上界
+    def exact_distance(self, u: Vertex, v: Vertex) -> int:
+        if len(self.landmarks) == 0:
+            return len(self.BFS_bidirectional(u, v)) - 1
+        lower, upper = self.estimate_distance(u, v)
+        if lower == upper:
+            return int(lower) if lower != math.inf else -1
+        adj = self.get_adj_function()
+        # 两侧使用相邻的两个 epoch 作为标记
+        epoch2 = self.next_epoch(2)
+        epochs = (epoch2 - 1, epoch2)
+        mark = self.search_mark
+        depth = self.search_depth
+        for w, epoch in ((u.id, epochs[0]), (v.id, epochs[1])):
+            mark[w] = epoch
+            depth[w] = 0
+        frontiers = [[u.id], [v.id]]
+        levels = [0, 0]
+        while levels[0] + levels[1] + 1 < upper:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1  # 扩展较小的一侧
+            if len(frontiers[side]) == 0:
+                return -1 if upper == math.inf else int(upper)
+            mine = epochs[side]
+            theirs = epochs[1 - side]
+            d = levels[side] + 1
+            # 逐层扩展时第一次相遇即为最短路, 相遇的顶在另一侧的深度必为 levels[1 - side]
+            if d + levels[1 - side] + 1 >= upper:  # 最后一层
+                for x in frontiers[side]:
+                    for y in adj(x):
+                        if mark[y] == theirs:
+                            return d + depth[y]
+                return int(upper)
+            next_frontier = []
+            for x in frontiers[side]:
+                for y in adj(x):
+                    m = mark[y]
+                    if m == theirs:
+                        return d + depth[y]
+                    elif m != mine:
+                        mark[y] = mine
+                        depth[y] = d
+                        next_frontier.append(y)
+            levels[side] = d
+            frontiers[side] = next_frontier
+        return int(upper)
 
 
 def get_id_list(l: List[Vertex]) -> List[int]:
@@ -243,8 +1203,15 @@ def get_id_list(l: List[Vertex]) -> List[int]:
 
 
 if __name__ == '__main__':
-    matrix = CSR_Matrix()
-    matrix.load_from_file('dataset/facebook_combined.txt')
+    snapshot = 'dataset/facebook_combined.csr'
+    start = time.time()
+    if os.path.exists(snapshot):
+        matrix = CSR_Matrix.open(snapshot)
+    else:
+        matrix = CSR_Matrix()
+        matrix.load_from_file('dataset/facebook_combined.txt')
+        matrix.save(snapshot)
+    print(f'load time = {time.time() - start} s')
     # 正确性测试与性能测试
     sum1 = 0
     sum2 = 0
@@ -265,3 +1232,205 @@ if __name__ == '__main__':
             print()
     print(f'avg time for BFS = {sum1 / n}')
     print(f'avg time for bidirectional BFS = {sum2 / n} s')
+    # 批量多源 BFS
+    pairs = [
+        (matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)],
+         matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)])
+        for _ in range(n)
+    ]
+    start = time.time()
+    dist, paths = matrix.batch_shortest_paths(pairs, with_paths=True)
+    sum3 = time.time() - start
+    for (v1, v2), d, path in zip(pairs, dist, paths):
+        if d != len(matrix.BFS_bidirectional(v1, v2)) - 1 or len(path) != d + 1:
+            print(f'error occurs!')
+            print(f'batch distance = {d}, path = {get_id_list(path)}')
+            print()
+    print(f'avg time for batch BFS = {sum3 / n} s')
+    # 方向优化的单源全图 BFS
+    sum4 = 0
+    m = 100
+    for _ in range(m):
+        v1 = matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)]
+        v2 = matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)]
+        start = time.time()
+        dist, parent = matrix.bfs_distances(v1)
+        sum4 += time.time() - start
+        if dist[v2.id] != len(matrix.BFS(v1, v2)) - 1:
+            print(f'error occurs!')
+            print(f'distance by bfs_distances = {dist[v2.id]}')
+            print()
+    print(f'avg time for full single-source BFS = {sum4 / m} s')
+    # 地标距离索引
+    start = time.time()
+    matrix.build_landmarks(16)
+    print(f'landmark index build time = {time.time() - start} s, memory = {matrix.landmark_dist.nbytes} bytes')
+    sum5 = 0
+    sum6 = 0
+    for _ in range(n):
+        v1 = matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)]
+        v2 = matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)]
+        start = time.time()
+        d = matrix.exact_distance(v1, v2)
+        sum5 += time.time() - start
+        start = time.time()
+        path = matrix.BFS_bidirectional(v1, v2)
+        sum6 += time.time() - start
+        lower, upper = matrix.estimate_distance(v1, v2)
+        if d != len(path) - 1 or not lower <= d <= upper:
+            print(f'error occurs!')
+            print(f'distance by landmarks = {d} in [{lower}, {upper}], path = {get_id_list(path)}')
+            print()
+    print(f'avg time for landmark exact distance = {sum5 / n} s, speedup = {sum6 / sum5}')
+    # 带权图上的 Dijkstra, 边权取随机值
+    weighted = CSR_Matrix()
+    weighted.load_from_edge_array(
+        np.loadtxt('dataset/facebook_combined.txt', dtype=np.int64, ndmin=2),
+        np.random.randint(1, 10, size=len(matrix.col) // 2).astype(np.float64)
+    )
+    sum7 = 0
+    sum8 = 0
+    for _ in range(m):
+        v1 = weighted.vertexes[random.randint(0, len(weighted.vertexes) - 1)]
+        v2 = weighted.vertexes[random.randint(0, len(weighted.vertexes) - 1)]
+        start = time.time()
+        d1, path1 = weighted.dijkstra(v1, v2)
+        sum7 += time.time() - start
+        start = time.time()
+        d2, path2 = weighted.dijkstra_bidirectional(v1, v2)
+        sum8 += time.time() - start
+        if d1 != d2:
+            print(f'error occurs!')
+            print(f'path by Dijkstra = {get_id_list(path1)}, distance = {d1}')
+            print(f'path by bidirectional Dijkstra = {get_id_list(path2)}, distance = {d2}')
+            print()
+    print(f'avg time for Dijkstra = {sum7 / m} s')
+    print(f'avg time for bidirectional Dijkstra = {sum8 / m} s')
+    # 顶点重排前后的对比: 邻点编号的平均跨度与 BFS 耗时
+    label_pairs = [
+        (int(matrix.labels[random.randint(0, len(matrix.vertexes) - 1)]),
+         int(matrix.labels[random.randint(0, len(matrix.vertexes) - 1)]))
+        for _ in range(n)
+    ]
+    for method in (None, 'degree', 'bfs', 'rcm'):
+        reordered = CSR_Matrix()
+        start = time.time()
+        reordered.load_from_file('dataset/facebook_combined.txt', reorder=method)
+        load_time = time.time() - start
+        src = np.repeat(np.arange(len(reordered.vertexes)), np.diff(reordered.col_offset))
+        gap = np.abs(src - reordered.col).mean()
+        pairs = [(reordered.get_vertex(a), reordered.get_vertex(b)) for a, b in label_pairs]
+        start = time.time()
+        for v1, v2 in pairs:
+            reordered.BFS(v1, v2)
+        sum9 = time.time() - start
+        print(f'reorder = {method}: load time = {load_time} s, avg neighbor id gap = {gap}, '
+              f'avg time for BFS = {sum9 / n} s')
+    # 逐次查询统计
+    stats = matrix.enable_stats()
+    sum1 = 0
+    sum2 = 0
+    for _ in range(n):
+        v1 = matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)]
+        v2 = matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)]
+        start = time.time()
+        matrix.BFS(v1, v2)
+        sum1 += time.time() - start
+        start = time.time()
+        matrix.BFS_bidirectional(v1, v2)
+        sum2 += time.time() - start
+    print(f'avg time for BFS with stats = {sum1 / n} s')
+    print(f'avg time for bidirectional BFS with stats = {sum2 / n} s')
+    print(stats.to_json())
+    matrix.disable_stats()
+    # 最短路计数与枚举
+    sum10 = 0
+    for _ in range(m):
+        v1 = matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)]
+        v2 = matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)]
+        start = time.time()
+        count = matrix.count_shortest_paths(v1, v2)
+        sum10 += time.time() - start
+        if count <= 10000:
+            paths = list(matrix.all_shortest_paths(v1, v2))
+            length = len(matrix.BFS_bidirectional(v1, v2))
+            if len(paths) != count or any(len(path) != length for path in paths):
+                print(f'error occurs!')
+                print(f'count = {count}, enumerated = {len(paths)}')
+                print()
+    print(f'avg time for counting shortest paths = {sum10 / m} s')
+    # k 跳邻居与自我网络
+    sum11 = 0
+    for _ in range(m):
+        v1 = matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)]
+        v2 = matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)]
+        start = time.time()
+        friends = matrix.k_hop(v1, 2)
+        common = matrix.common_k_hop(v1, v2, 2)
+        sum11 += time.time() - start
+        dist1, _ = matrix.bfs_distances(v1)
+        dist2, _ = matrix.bfs_distances(v2)
+        if not np.array_equal(friends, np.flatnonzero((dist1 >= 1) & (dist1 <= 2))) or \
+                not np.array_equal(common, np.setdiff1d(np.flatnonzero((dist1 >= 0) & (dist1 <= 2) & (dist2 >= 0) & (dist2 <= 2)), [v1.id, v2.id])):
+            print(f'error occurs in k-hop query!')
+            print()
+    print(f'avg time for 2-hop and common 2-hop queries = {sum11 / m} s')
+    ego = matrix.ego_network(matrix.vertexes[0])
+    print(f'ego network of vertex 0: {len(ego.vertexes)} vertexes, {len(ego.col) // 2} edges')
+    # 压缩存储的压缩率与遍历速度
+    compressed = CSR_Matrix()
+    compressed.load_from_file('dataset/facebook_combined.txt')
+    plain_bytes = compressed.col.nbytes
+    list_bytes = len(compressed.col) * (8 + 28)  # Python list 中的 int 对象
+    start = time.time()
+    compressed.compress()
+    print(f'compress time = {time.time() - start} s, {compressed.compressed_nbytes()} bytes, '
+          f'ratio = {plain_bytes / compressed.compressed_nbytes()} vs int32 array, '
+          f'{list_bytes / compressed.compressed_nbytes()} vs Python list')
+    sum12 = 0
+    sum13 = 0
+    for _ in range(n):
+        v1 = random.randint(0, len(matrix.vertexes) - 1)
+        v2 = random.randint(0, len(matrix.vertexes) - 1)
+        start = time.time()
+        path1 = matrix.BFS_bidirectional(matrix.vertexes[v1], matrix.vertexes[v2])
+        sum12 += time.time() - start
+        start = time.time()
+        path2 = compressed.BFS_bidirectional(compressed.vertexes[v1], compressed.vertexes[v2])
+        sum13 += time.time() - start
+        if len(path1) != len(path2):
+            print(f'error occurs!')
+            print(f'path by plain layout = {get_id_list(path1)}')
+            print(f'path by compressed layout = {get_id_list(path2)}')
+            print()
+    print(f'avg time for bidirectional BFS: plain = {sum12 / n} s, compressed = {sum13 / n} s')
+    # 先建地标再压缩, 之后的查询、向量化计算与增量修改合并都不应解压存储
+    landmarked = CSR_Matrix()
+    landmarked.load_from_file('dataset/facebook_combined.txt')
+    landmarked.build_landmarks(4)
+    landmarked.compress()
+    for _ in range(m):
+        v1 = random.randint(0, len(matrix.vertexes) - 1)
+        v2 = random.randint(0, len(matrix.vertexes) - 1)
+        d = landmarked.exact_distance(landmarked.vertexes[v1], landmarked.vertexes[v2])
+        if d != len(matrix.BFS_bidirectional(matrix.vertexes[v1], matrix.vertexes[v2])) - 1:
+            print(f'error occurs in exact distance on compressed layout!')
+            print()
+    v1 = random.randint(0, len(matrix.vertexes) - 1)
+    if not np.array_equal(landmarked.bfs_distances(landmarked.vertexes[v1])[0],
+                          matrix.bfs_distances(matrix.vertexes[v1])[0]) or \
+            not np.array_equal(landmarked.k_hop(landmarked.vertexes[v1], 2), matrix.k_hop(matrix.vertexes[v1], 2)):
+        print(f'error occurs in vectorized kernels on compressed layout!')
+        print()
+    plain = CSR_Matrix()
+    plain.load_from_file('dataset/facebook_combined.txt')
+    for _ in range(100):
+        v1 = random.randint(0, len(matrix.vertexes) - 1)
+        v2 = random.randint(0, len(matrix.vertexes) - 1)
+        for graph in (plain, landmarked):
+            graph.add_edge(graph.vertexes[v1], graph.vertexes[v2])
+    plain.compact()
+    landmarked.compact()
+    if landmarked.compressed is None or not np.array_equal(landmarked.get_col(), plain.col):
+        print(f'error occurs in compact on compressed layout!')
+        print()
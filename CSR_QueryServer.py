@@ -0,0 +1,129 @@
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from CSR_Matrix import CSR_Matrix, Vertex
+
+# 工作进程中的只读图, 由 attach 初始化
+_matrix: Optional[CSR_Matrix] = None
+_shms: List[shared_memory.SharedMemory] = []
+
+
+# 工作进程启动时挂接共享内存, 数组直接引用共享内存, 不复制
+def attach(specs: List[Tuple[str, str, str, int]]):
+    global _matrix
+    matrix = CSR_Matrix()
+    for attr, name, dtype, length in specs:
+        # 进程池的子进程与主进程共用同一个 resource_tracker, 由主进程负责回收
+        shm = shared_memory.SharedMemory(name=name)
+        _shms.append(shm)
+        array = np.ndarray(shape=length, dtype=dtype, buffer=shm.buf)
+        array.flags.writeable = False
+        setattr(matrix, attr, array)
+    matrix.vertexes = [Vertex(id) for id in range(len(matrix.labels))]
+    _matrix = matrix
+
+
+def run_queries(bidirectional: bool, pairs: List[Tuple[int, int]]) -> List[List[int]]:
+    vertexes = _matrix.vertexes
+    search = _matrix.BFS_bidirectional if bidirectional else _matrix.BFS
+    return [[v.id for v in search(vertexes[s], vertexes[t])] for s, t in pairs]
+
+
+class CSR_QueryServer:
+    """把 CSR 数组放进共享内存, 由进程池并行回答 BFS 查询, 结果为顶的内部编号列表"""
+    matrix: CSR_Matrix
+    shms: List[shared_memory.SharedMemory]
+    executor: ProcessPoolExecutor
+
+    def __init__(self, matrix: CSR_Matrix, workers: Optional[int] = None) -> None:
+        matrix.compact()  # 工作进程只读取完整的 CSR 数组, 压缩存储时只把解码出的 col 放进共享内存
+        self.matrix = matrix
+        self.shms = []
+        specs = []
+        for attr in ('col_offset', 'col', 'labels'):
+            array = np.ascontiguousarray(matrix.get_col() if attr == 'col' else getattr(matrix, attr))
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(shape=len(array), dtype=array.dtype, buffer=shm.buf)[:] = array
+            self.shms.append(shm)
+            specs.append((attr, shm.name, array.dtype.str, len(array)))
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=attach, initargs=(specs,))
+
+    def submit(self, start: Vertex, end: Vertex, bidirectional: bool = True) -> Future:
+        future = Future()
+        inner = self.executor.submit(run_queries, bidirectional, [(start.id, end.id)])
+
+        def done(f: Future):
+            if f.exception() is not None:
+                future.set_exception(f.exception())
+            else:
+                future.set_result(f.result()[0])
+
+        inner.add_done_callback(done)
+        return future
+
+    def submit_BFS(self, start: Vertex, end: Vertex) -> Future:
+        return self.submit(start, end, bidirectional=False)
+
+    def submit_BFS_bidirectional(self, start: Vertex, end: Vertex) -> Future:
+        return self.submit(start, end, bidirectional=True)
+
+    # 批量查询, 每个任务携带 chunk_size 对, 摊薄进程间通信的开销
+    def map(self, pairs: Iterable[Tuple[Vertex, Vertex]], bidirectional: bool = True,
+            chunk_size: int = 64) -> List[List[int]]:
+        pairs = [(s.id, t.id) for s, t in pairs]
+        futures = [
+            self.executor.submit(run_queries, bidirectional, pairs[i:i + chunk_size])
+            for i in range(0, len(pairs), chunk_size)
+        ]
+        return [path for f in futures for path in f.result()]
+
+    async def query(self, start: Vertex, end: Vertex, bidirectional: bool = True) -> List[int]:
+        return await asyncio.wrap_future(self.submit(start, end, bidirectional))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+        self.shms = []
+
+    def __enter__(self) -> 'CSR_QueryServer':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    matrix = CSR_Matrix()
+    matrix.load_from_file('dataset/facebook_combined.txt')
+    n = 2000
+    pairs = [
+        (matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)],
+         matrix.vertexes[random.randint(0, len(matrix.vertexes) - 1)])
+        for _ in range(n)
+    ]
+    start = time.time()
+    expected = [[v.id for v in matrix.BFS(v1, v2)] for v1, v2 in pairs]
+    serial = time.time() - start
+    print(f'serial BFS: {n / serial} queries/s')
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        with CSR_QueryServer(matrix, workers) as server:
+            server.map(pairs[:workers])  # 预热, 让所有进程完成挂接
+            start = time.time()
+            paths = server.map(pairs, bidirectional=False)
+            cost = time.time() - start
+            for path1, path2 in zip(expected, paths):
+                if len(path1) != len(path2):
+                    print(f'error occurs!')
+                    print(f'path by BFS = {path1}')
+                    print(f'path by server = {path2}')
+                    print()
+            path = asyncio.run(server.query(pairs[0][0], pairs[0][1]))
+            assert len(path) == len(expected[0])
+        print(f'{workers} workers: {n / cost} queries/s, speedup = {serial / cost}')
@@ -0,0 +1,190 @@
+import random
+import time
+import gc
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from IntervalTree import Interval, RedBlackTree
+
+pd.options.display.max_columns = None
+pd.options.display.max_rows = None
+pd.options.display.width = 1000
+
+
+class IntervalIndex:
+    """只读的闭区间索引, 一次调用批量回答一组查询点或查询区间
+
+    区间按长度级 (high - low 的二进制指数) 分桶, 桶内按 low 排序并存 high 的前缀最大值,
+    查询 [a, b] 时每个桶内的候选是一段连续下标 [l, r):
+    r 由 low <= b 二分得到, l 由前缀最大值 >= a 二分得到, 桶内区间长度相近, 候选中不相交的很少
+    """
+    lows: np.ndarray  # 按 (长度级, low) 排序
+    highs: np.ndarray
+    ids: np.ndarray  # 区间的原编号
+    running_max: np.ndarray  # 每个桶内 high 的前缀最大值
+    bucket_offset: np.ndarray  # 第 c 个桶占 [bucket_offset[c], bucket_offset[c + 1])
+    sorted_lows: np.ndarray  # 只用于计数
+    sorted_highs: np.ndarray
+
+    def __init__(self, lows, highs) -> None:
+        lows = np.asarray(lows)
+        highs = np.asarray(highs)
+        if lows.shape != highs.shape or lows.ndim != 1:
+            raise ValueError("'lows' and 'highs' must be 1-d arrays of the same length")
+        if (highs < lows).any():
+            raise ValueError("'high' must not be less than 'low'")
+        _, bucket = np.frexp((highs - lows).astype(np.float64))  # 长度为 0 的区间在 0 号桶
+        order = np.lexsort((lows, bucket))
+        self.lows = lows[order]
+        self.highs = highs[order]
+        self.ids = order.astype(np.int64)
+        bucket = bucket[order]
+        self.bucket_offset = np.flatnonzero(np.diff(bucket, prepend=bucket[:1] - 1, append=bucket[-1:] + 1))
+        self.running_max = np.empty_like(self.highs)
+        for begin, end in zip(self.bucket_offset[:-1], self.bucket_offset[1:]):
+            np.maximum.accumulate(self.highs[begin:end], out=self.running_max[begin:end])
+        self.sorted_lows = np.sort(lows)
+        self.sorted_highs = np.sort(highs)
+
+    # 编号为区间在树中的中序位置, 即 list(tree) 中的下标
+    @classmethod
+    def from_tree(cls, tree: RedBlackTree) -> 'IntervalIndex':
+        intervals = list(tree)
+        return cls([interval.low for interval in intervals], [interval.high for interval in intervals])
+
+    def __len__(self) -> int:
+        return len(self.lows)
+
+    # 与 [a, b] 相交的区间个数 = low <= b 的个数 - high < a 的个数 (high < a 的区间必有 low <= b)
+    def overlap_count(self, lows, highs) -> np.ndarray:
+        lows = np.asarray(lows)
+        highs = np.asarray(highs)
+        return (np.searchsorted(self.sorted_lows, highs, side='right')
+                - np.searchsorted(self.sorted_highs, lows, side='left'))
+
+    def stab_count(self, points) -> np.ndarray:
+        return self.overlap_count(points, points)
+
+    # 返回 CSR 形式的结果: 第 i 个查询命中的区间编号为 hits[offset[i]:offset[i + 1]], 行内按编号升序
+    def overlap(self, lows, highs, chunk_size: int = 1 << 16) -> Tuple[np.ndarray, np.ndarray]:
+        lows = np.asarray(lows)
+        highs = np.asarray(highs)
+        query_num = len(lows)
+        # 查询按 low 排序后再二分, 访存更集中, 结果中的查询编号再映射回原顺序
+        query_order = np.argsort(lows, kind='stable')
+        lows = lows[query_order]
+        highs = highs[query_order]
+        query_parts = []
+        hit_parts = []
+        for begin in range(0, query_num, chunk_size):  # 分块展开候选, 控制内存
+            a = lows[begin:begin + chunk_size]
+            b = highs[begin:begin + chunk_size]
+            for bucket_begin, bucket_end in zip(self.bucket_offset[:-1], self.bucket_offset[1:]):
+                r = np.searchsorted(self.lows[bucket_begin:bucket_end], b, side='right')
+                l = np.searchsorted(self.running_max[bucket_begin:bucket_end], a, side='left')
+                lens = np.maximum(r - l, 0)
+                total = int(lens.sum())
+                if total == 0:
+                    continue
+                seg_begin = np.cumsum(lens) - lens
+                query = np.repeat(np.arange(begin, begin + len(a), dtype=np.int64), lens)
+                index = np.repeat(l + bucket_begin - seg_begin, lens) + np.arange(total, dtype=np.int64)
+                hit = self.highs[index] >= lows[query]
+                query_parts.append(query[hit])
+                hit_parts.append(self.ids[index[hit]])
+        query = query_order[np.concatenate(query_parts)] if query_parts else np.zeros(shape=0, dtype=np.int64)
+        hits = np.concatenate(hit_parts) if hit_parts else np.zeros(shape=0, dtype=np.int64)
+        order = np.lexsort((hits, query))
+        offset = np.zeros(shape=query_num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(query, minlength=query_num), out=offset[1:])
+        return offset, hits[order]
+
+    def stab(self, points, chunk_size: int = 1 << 16) -> Tuple[np.ndarray, np.ndarray]:
+        return self.overlap(points, points, chunk_size)
+
+
+if __name__ == '__main__':
+    print('===== 正确性测试 =====')
+    for _ in range(200):
+        n = random.randint(0, 300)
+        if random.random() > 1 / 2:
+            lows = np.random.randint(0, 1000, size=n)
+            highs = lows + np.random.randint(0, 1000, size=n) // np.random.randint(1, 100, size=n)
+            queries = np.random.randint(-10, 2100, size=100)
+        else:
+            lows = np.random.uniform(0, 1000, size=n)
+            highs = lows + np.random.exponential(10, size=n)
+            queries = np.random.uniform(-10, 1100, size=100)
+        query_highs = queries + np.random.randint(0, 50, size=len(queries))
+        print(f'\t> {n} intervals, dtype = {lows.dtype}')
+        index = IntervalIndex(lows, highs)
+        offset, hits = index.overlap(queries, query_highs, chunk_size=16)
+        counts = index.overlap_count(queries, query_highs)
+        for i, (a, b) in enumerate(zip(queries, query_highs)):
+            expected = np.flatnonzero((lows <= b) & (highs >= a))
+            assert (hits[offset[i]:offset[i + 1]] == expected).all() and counts[i] == len(expected)
+        offset, hits = index.stab(queries)
+        assert (np.diff(offset) == index.stab_count(queries)).all()
+        for i, point in enumerate(queries):
+            assert (hits[offset[i]:offset[i + 1]] == np.flatnonzero((lows <= point) & (highs >= point))).all()
+    # 由区间树建索引, 编号为中序位置
+    tree = RedBlackTree()
+    for _ in range(1000):
+        low = random.randint(0, 999)
+        tree.insert(Interval(low, low + random.randint(0, 99)))
+    intervals = list(tree)
+    index = IntervalIndex.from_tree(tree)
+    points = np.random.randint(0, 1100, size=100)
+    offset, hits = index.stab(points)
+    for i, point in enumerate(points):
+        expected = sorted(id(interval) for interval in tree.stab(int(point)))
+        assert sorted(id(intervals[j]) for j in hits[offset[i]:offset[i + 1]]) == expected
+    print('===== 正确性测试通过 =====')
+    print()
+    print('===== 性能测试 =====')
+    # 类似基因组注释: 大量短区间混入少量很长的区间, 查询点均匀分布
+    k_list = [10, 12, 14, 16, 18, 20]
+    query_num = 2 ** 16
+    time_cost = pd.DataFrame(
+        index=pd.Index(data=[f'2^{k}' for k in k_list], name='n=2^k'),
+        columns=pd.Index(['build cost', 'stab_count cost', 'stab cost', 'overlap cost',
+                          'tree stab cost', 'hits per query']),
+        dtype=float
+    )
+    gc.disable()
+    for k in k_list:
+        n = 2 ** k
+        domain = 1000 * n
+        lows = np.random.randint(0, domain, size=n)
+        highs = lows + np.random.lognormal(mean=6, sigma=2, size=n).astype(np.int64)
+        points = np.random.randint(0, domain, size=query_num)
+        start = time.time()
+        index = IntervalIndex(lows, highs)
+        end = time.time()
+        time_cost.loc[f'2^{k}', 'build cost'] = end - start
+        start = time.time()
+        counts = index.stab_count(points)
+        end = time.time()
+        time_cost.loc[f'2^{k}', 'stab_count cost'] = end - start
+        time_cost.loc[f'2^{k}', 'hits per query'] = counts.mean()
+        start = time.time()
+        offset, hits = index.stab(points)
+        end = time.time()
+        time_cost.loc[f'2^{k}', 'stab cost'] = end - start
+        assert (np.diff(offset) == counts).all()
+        start = time.time()
+        index.overlap(points, points + 1000)
+        end = time.time()
+        time_cost.loc[f'2^{k}', 'overlap cost'] = end - start
+        # 区间树逐个查询, 只做 1000 次, 按 query_num 次折算
+        tree = RedBlackTree.from_sorted(Interval(int(low), int(high)) for low, high in zip(lows, highs))
+        start = time.time()
+        for point in points[:1000].tolist():
+            for _ in tree.stab(point):
+                pass
+        end = time.time()
+        time_cost.loc[f'2^{k}', 'tree stab cost'] = (end - start) * query_num / 1000
+    print(time_cost)
+    gc.enable()
+    gc.collect()
+    print('===== 性能测试结束 =====')
@@ -2,6 +2,7 @@ import random
 import time
 import math
 import gc
+import tracemalloc
 from typing import Tuple
 from enum import Enum, unique
 import pandas as pd
@@ -18,119 +19,46 @@ class Color(Enum):
 
 
 class Interval:
-    @property
-    def low(self):
-        return self.__low
-
-    @low.setter
-    def low(self, value):
-        if not isinstance(value, type(self.__low)):
-            raise TypeError(f"'low must be instance of '{type(self.low)}'")
-        self.__low = value
-
-    @property
-    def high(self):
-        return self.__high
-
-    @high.setter
-    def high(self, value):
-        if not isinstance(value, type(self.__high)):
-            raise TypeError(f"'high must be instance of '{type(self.low)}'")
-        self.__high = value
+    __slots__ = ('low', 'high')
 
     def __init__(self, low, high) -> None:
         if not isinstance(low, type(high)):
             raise TypeError("'low' and 'high' must be same type")
         assert low is not None and high is not None
-        self.__low = low
-        self.__high = high
+        self.low = low
+        self.high = high
 
     def __str__(self) -> str:
         return f'[{self.low}, {self.high}]'
 
 
 class Node:
+    # 用 __slots__ 存放普通属性, 不建 __dict__, 也不经过 property 检查, 颜色用 bool 表示 (red)
+    # key 缓存 interval.low, 修改 interval 时须同步修改 key
+    __slots__ = ('red', 'interval', 'key', 'max', 'parent', 'left', 'right')
 
+    # 兼容旧接口, 以 Color 读写颜色
     @property
-    def color(self):
-        return self.__color
+    def color(self) -> Color:
+        return Color.Red if self.red else Color.Black
 
     @color.setter
-    def color(self, value):
+    def color(self, value: Color):
         if not isinstance(value, Color):
             raise TypeError("'color' must be instance of 'Color'")
-        self.__color = value
-
-    @property
-    def interval(self):
-        return self.__interval
-
-    @interval.setter
-    def interval(self, value):
-        if not isinstance(value, Interval):
-            raise TypeError("'interval' must be instance of 'Interval'")
-        self.__interval = value
-
-    @property
-    def key(self):
-        return self.interval.low
-
-    @property
-    def max(self):
-        return self.__max
-
-    @max.setter
-    def max(self, value):
-        if not isinstance(value, type(self.__max)):
-            raise TypeError(f"'max' must be instance of '{type(self.__max)}'")
-        self.__max = value
-
-    @property
-    def parent(self):
-        assert self.__parent is not None
-        return self.__parent
-
-    @parent.setter
-    def parent(self, value):
-        if not isinstance(value, Node):
-            raise TypeError("'parent' must be instance of 'Node'")
-        self.__parent = value
-
-    @property
-    def left(self):
-        assert self.__left is not None
-        return self.__left
-
-    @left.setter
-    def left(self, value):
-        if not isinstance(value, Node):
-            raise TypeError("'left' must be instance of 'Node'")
-        self.__left = value
-
-    @property
-    def right(self):
-        assert self.__right is not None
-        return self.__right
-
-    @right.setter
-    def right(self, value):
-        if not isinstance(value, Node):
-            raise TypeError("'right' must be instance of 'Node'")
-        self.__right = value
+        self.red = value is Color.Red
 
     def __init__(self, color: Color, interval: Interval, parent=None, left=None, right=None) -> None:
-        self.color = color
+        self.red = color is Color.Red
         self.interval = interval
-        self.__max = interval.high
-        if parent is not None:
-            self.parent = parent
-        if left is not None:
-            self.left = left
-        if right is not None:
-            self.right = right
+        self.key = interval.low
+        self.max = interval.high
+        self.parent = parent
+        self.left = left
+        self.right = right
 
     def __str__(self) -> str:
-        if self.color == Color.Red:
+        if self.red:
             return f'\x1b[38;2;255;0;0m{self.interval}, max={self.max}\x1b[0m'
         else:
             return f'{self.interval}, max={self.max}'
@@ -215,41 +143,41 @@ class RedBlackTree:
     def insert_fixup(self, node: Node):
         z = node
         # z 的颜色为 红，父节点不能是红
-        while z.parent.color == Color.Red:
+        while z.parent.red:
             if z.parent is z.parent.parent.left:
                 y = z.parent.parent.right
-                if y.color == Color.Red:  # case 1
-                    z.parent.color = Color.Black
-                    y.color = Color.Black
-                    z.parent.parent.color = Color.Red
+                if y.red:  # case 1
+                    z.parent.red = False
+                    y.red = False
+                    z.parent.parent.red = True
                     z = z.parent.parent
                 else:
                     if z is z.parent.right:  # case 2
                         z = z.parent
                         self.left_rotate(z)
-                    z.parent.color = Color.Black  # case 3
-                    z.parent.parent.color = Color.Red
+                    z.parent.red = False  # case 3
+                    z.parent.parent.red = True
                     self.right_rotate(z.parent.parent)
             else:
                 y = z.parent.parent.left
-                if y.color == Color.Red:  # case 4
-                    z.parent.color = Color.Black
-                    y.color = Color.Black
-                    z.parent.parent.color = Color.Red
+                if y.red:  # case 4
+                    z.parent.red = False
+                    y.red = False
+                    z.parent.parent.red = True
                     z = z.parent.parent
                 else:
                     if z is z.parent.left:  # case 5
                         z = z.parent
                         self.right_rotate(z)
-                    z.parent.color = Color.Black  # case 6
-                    z.parent.parent.color = Color.Red
+                    z.parent.red = False  # case 6
+                    z.parent.parent.red = True
                     self.left_rotate(z.parent.parent)
-        self.root.color = Color.Black
+        self.root.red = False
 
     def insert_node(self, node: Node):
         node.left = self.nil
         node.right = self.nil
-        node.color = Color.Red
+        node.red = True
         now = self.root  # 当前查找结点
         pre = now.parent  # 当前节点的父节点, 引入 pre 的作用在于 nil.parent 无定义
         while now is not self.nil:
@@ -289,50 +217,50 @@ class RedBlackTree:
 
     def delete_fixup(self, node: Node):
         x = node
-        while x is not self.root and x.color == Color.Black:
+        while x is not self.root and not x.red:
             if x is x.parent.left:
                 w = x.parent.right
-                if w.color == Color.Red:
-                    w.color = Color.Black
-                    x.parent.color = Color.Red
+                if w.red:
+                    w.red = False
+                    x.parent.red = True
                     self.left_rotate(x.parent)
                     w = x.parent.right
-                if w.left.color == Color.Black and w.right.color == Color.Black:
-                    w.color = Color.Red
+                if not w.left.red and not w.right.red:
+                    w.red = True
                     x = x.parent
                 else:
-                    if w.right.color == Color.Black:
-                        w.left.color = Color.Black
-                        w.color = Color.Red
+                    if not w.right.red:
+                        w.left.red = False
+                        w.red = True
                         self.right_rotate(w)
                         w = x.parent.right
-                    w.color = x.parent.color
-                    x.parent.color = Color.Black
-                    w.right.color = Color.Black
+                    w.red = x.parent.red
+                    x.parent.red = False
+                    w.right.red = False
                     self.left_rotate(x.parent)
                     x = self.root
             else:
                 w = x.parent.left
-                if w.color == Color.Red:
-                    w.color = Color.Black
-                    x.parent.color = Color.Red
+                if w.red:
+                    w.red = False
+                    x.parent.red = True
                     self.right_rotate(x.parent)
                     w = x.parent.left
-                if w.left.color == Color.Black and w.right.color == Color.Black:
-                    w.color = Color.Red
+                if not w.left.red and not w.right.red:
+                    w.red = True
                     x = x.parent
                 else:
-                    if w.left.color == Color.Black:
-                        w.right.color = Color.Black
-                        w.color = Color.Red
+                    if not w.left.red:
+                        w.right.red = False
+                        w.red = True
                         self.left_rotate(w)
                         w = x.parent.left
-                    w.color = x.parent.color
-                    x.parent.color = Color.Black
-                    w.left.color = Color.Black
+                    w.red = x.parent.red
+                    x.parent.red = False
+                    w.left.red = False
                     self.right_rotate(x.parent)
                     x = self.root
-        x.color = Color.Black
+        x.red = False
 
     def delete_node(self, node: Node):
         z = node
@@ -347,8 +275,9 @@ class RedBlackTree:
         self.transplant(y, x)
         if y is not z:  # case 3
             z.interval = y.interval
+            z.key = y.key
         self.max_fixup(x.parent)
-        if y.color == Color.Black:  # 删除黑节点需要 fixup
+        if not y.red:  # 删除黑节点需要 fixup
             self.delete_fixup(x)
 
     def find_by_index_recursive(self, now: Node, index: int) -> Tuple[Node, int]:
@@ -380,11 +309,84 @@ class RedBlackTree:
             now = now.left
         return now
 
+    # 返回任意一个与 interval 相交的结点, 没有则返回 nil, O(log(n))
+    # 左子树的 max 不小于 low 时, 若左子树中没有相交的区间, 右子树中也不会有
+    def search_any(self, interval: Interval) -> Node:
+        low, high = interval.low, interval.high
+        now = self.root
+        while now is not self.nil and (now.key > high or now.interval.high < low):
+            if now.left.max >= low:
+                now = now.left
+            else:
+                now = now.right
+        return now
+
+    # 按 low 的顺序逐个产生与闭区间 [low, high] 相交的区间
+    # max < low 的子树整个跳过, key > high 之后的结点都不会相交, 每个结果只多走 O(log(n)) 个结点
+    def overlap(self, low, high):
+        stack = []
+        now = self.root
+        while True:
+            while now is not self.nil and now.max >= low:
+                stack.append(now)
+                now = now.left
+            if not stack:
+                return
+            now = stack.pop()
+            if now.key > high:
+                return
+            if now.interval.high >= low:
+                yield now.interval
+            now = now.right
+
+    def search_all(self, interval: Interval):
+        return self.overlap(interval.low, interval.high)
+
+    # 包含 point 的所有区间
+    def stab(self, point):
+        return self.overlap(point, point)
+
+    def __iter__(self):
+        stack = []
+        now = self.root
+        while stack or now is not self.nil:
+            while now is not self.nil:
+                stack.append(now)
+                now = now.left
+            now = stack.pop()
+            yield now.interval
+            now = now.right
+
+    # 由按 low 有序的区间列表的 [lo, hi) 段建出完全平衡的子树, 只有深度为 red_depth 的结点为红, max 自底向上求出
+    def build_node(self, intervals: list, lo: int, hi: int, parent: Node, depth: int, red_depth: int) -> Node:
+        if lo >= hi:
+            return self.nil
+        mid = (lo + hi) // 2
+        node = Node(Color.Black, intervals[mid], parent, self.nil, self.nil)
+        node.red = depth == red_depth
+        node.left = self.build_node(intervals, lo, mid, node, depth + 1, red_depth)
+        node.right = self.build_node(intervals, mid + 1, hi, node, depth + 1, red_depth)
+        node.fixMax()
+        return node
+
+    # O(n) 批量建树, 输入不按 low 有序时先排序, O(n log(n))
+    # 左右子树结点数至多差 1, 叶子的深度只差 1, 把最深一层染红即满足黑高相等
+    @classmethod
+    def from_sorted(cls, iterable) -> 'RedBlackTree':
+        intervals = list(iterable)
+        if any(a.low > b.low for a, b in zip(intervals, intervals[1:])):
+            intervals.sort(key=lambda interval: interval.low)
+        tree = cls()
+        n = len(intervals)
+        red_depth = n.bit_length() - 1 if n > 1 else -1  # 只有一个结点时根必须为黑
+        tree.root = tree.build_node(intervals, 0, n, tree.nil, 0, red_depth)
+        return tree
+
     # 如果正常则返回黑高，异常返回 -1
     def check_recursive(self, node: Node, pre_node: Node) -> int:
         if node is self.nil:
             return 0
-        if node.color == Color.Red and (node.left.color == Color.Red or node.right.color == Color.Red):
+        if node.red and (node.left.red or node.right.red):
             return -1
         l = self.check_recursive(node.left, pre_node)
         if pre_node is not self.nil and pre_node.key > node.key:
@@ -398,7 +400,7 @@ class RedBlackTree:
             return -1
         r = self.check_recursive(node.right, node)
         if l == r and l != -1:
-            if node.color == Color.Red:
+            if node.red:
                 return l
             else:
                 return l + 1
@@ -407,7 +409,7 @@ class RedBlackTree:
 
     # 检查是否满足红黑树的性质
     def check(self) -> bool:
-        if self.root.parent is not self.nil or self.root.color != Color.Black or self.nil.color != Color.Black:
+        if self.root.parent is not self.nil or self.root.red or self.nil.red:
             return False
         return self.check_recursive(self.root, self.nil) != -1
 
@@ -442,8 +444,77 @@ if __name__ == '__main__':
             n -= 1
             # print(tree)
         assert tree.check()
+        # 查询结果与线性扫描对照
+        low = random.randint(0, 1999)
+        query = Interval(low, low + random.randint(0, 99))
+        expected = [interval for interval in tree if interval.low <= query.high and query.low <= interval.high]
+        assert list(tree.search_all(query)) == expected
+        node = tree.search_any(query)
+        assert (node is tree.nil) if not expected else any(node.interval is interval for interval in expected)
+        assert list(tree.stab(low)) == [interval for interval in tree if interval.low <= low <= interval.high]
+    # 批量建树, 建好后仍可正常增删
+    for size in list(range(10)) + [random.randint(10, 2000) for _ in range(20)]:
+        intervals = []
+        for _ in range(size):
+            low = random.randint(0, 99)
+            intervals.append(Interval(low, low + random.randint(0, 99)))
+        print(f'\t> from_sorted with {size} intervals')
+        tree = RedBlackTree.from_sorted(intervals)
+        assert tree.check()
+        for _ in range(size // 2):
+            low = random.randint(0, 99)
+            tree.insert(Interval(low, low + random.randint(0, 99)))
+            tree.delete_by_index(random.randint(0, size - 1))
+        assert tree.check()
     print('===== 正确性测试通过 =====')
     print()
+    print('===== 内存测试 =====')
+    n = 2 ** 16
+    keys = []
+    for _ in range(n):
+        low = random.randint(0, 999)
+        keys.append(Interval(low, low + random.randint(0, 999)))
+    tree.clear()
+    tracemalloc.start()
+    for key in keys:
+        tree.insert(key)
+    print(f'n=2^16, memory per node = {tracemalloc.get_traced_memory()[0] / n:.0f} B')
+    tracemalloc.stop()
+    print('===== 内存测试结束 =====')
+    print()
+    print('===== 批量建树测试 =====')
+    gc.disable()
+    bulk_list = [10, 14, 18, 20]
+    bulk_cost = pd.DataFrame(
+        index=pd.Index(data=[f'2^{k}' for k in bulk_list], name='n=2^k'),
+        columns=pd.Index(['insert one by one', 'from_sorted (sorted)', 'from_sorted (unsorted)']),
+        dtype=float
+    )
+    for k in bulk_list:
+        keys = []
+        for _ in range(2 ** k):
+            low = random.randint(0, 999)
+            keys.append(Interval(low, low + random.randint(0, 999)))
+        sorted_keys = sorted(keys, key=lambda interval: interval.low)
+        tree.clear()
+        start = time.time()
+        for key in keys:
+            tree.insert(key)
+        end = time.time()
+        bulk_cost.loc[f'2^{k}', 'insert one by one'] = end - start
+        start = time.time()
+        tree = RedBlackTree.from_sorted(sorted_keys)
+        end = time.time()
+        bulk_cost.loc[f'2^{k}', 'from_sorted (sorted)'] = end - start
+        start = time.time()
+        tree = RedBlackTree.from_sorted(keys)
+        end = time.time()
+        bulk_cost.loc[f'2^{k}', 'from_sorted (unsorted)'] = end - start
+    print(bulk_cost)
+    gc.enable()
+    gc.collect()
+    print('===== 批量建树测试结束 =====')
+    print()
     print('===== 性能测试 =====')
     k_list = list(range(1, 21, 1))
     time_cost = pd.DataFrame(
@@ -453,7 +524,7 @@ if __name__ == '__main__':
         dtype=float
     )
     gc.disable()  # 避免 gc 造成性能波动
-    tree.clear()
+    intervals = []
     last_n = 0
     for k in k_list:
         n = 2 ** k
@@ -462,7 +533,9 @@ if __name__ == '__main__':
         for _ in range(delta):
             low = random.randint(0, 999)
             high = random.randint(low, 999 + 1)
-            tree.insert(Interval(low, high))
+            intervals.append(Interval(low, high))
+        intervals.sort(key=lambda interval: interval.low)
+        tree = RedBlackTree.from_sorted(intervals)  # 批量重建, O(n)
         insert_sum_time = 0
         delete_sum_time = 0
         repeat_times = 10000
@@ -487,3 +560,54 @@ if __name__ == '__main__':
     gc.enable()
     gc.collect()
     print('===== 性能测试结束 =====')
+    print()
+    print('===== 查询测试 =====')
+    # 区间端点分布在 [0, 16n) 上, 长度不超过 100, 每次查询的结果个数与 n 无关
+    query_cost = pd.DataFrame(
+        index=pd.Index(data=[f'2^{k}' for k in k_list], name='n=2^k'),
+        columns=pd.Index(['search_any cost', 'search_all cost', 'stab cost', 'linear scan cost', 'hits per query']),
+        dtype=float
+    )
+    gc.disable()
+    for k in k_list:
+        n = 2 ** k
+        intervals = []
+        for _ in range(n):
+            low = random.randint(0, 16 * n)
+            intervals.append(Interval(low, low + random.randint(0, 100)))
+        tree = RedBlackTree.from_sorted(intervals)
+        queries = []
+        for _ in range(1000):
+            low = random.randint(0, 16 * n)
+            queries.append(Interval(low, low + random.randint(0, 100)))
+        start = time.time()
+        for query in queries:
+            tree.search_any(query)
+        end = time.time()
+        query_cost.loc[f'2^{k}', 'search_any cost'] = end - start
+        hits = 0
+        start = time.time()
+        for query in queries:
+            for _ in tree.search_all(query):
+                hits += 1
+        end = time.time()
+        query_cost.loc[f'2^{k}', 'search_all cost'] = end - start
+        query_cost.loc[f'2^{k}', 'hits per query'] = hits / len(queries)
+        start = time.time()
+        for query in queries:
+            for _ in tree.stab(query.low):
+                pass
+        end = time.time()
+        query_cost.loc[f'2^{k}', 'stab cost'] = end - start
+        # 线性扫描太慢, 只做 10 次, 按 1000 次折算
+        start = time.time()
+        for query in queries[:10]:
+            for interval in intervals:
+                if interval.low <= query.high and query.low <= interval.high:
+                    pass
+        end = time.time()
+        query_cost.loc[f'2^{k}', 'linear scan cost'] = (end - start) * 100
+    print(query_cost)
+    gc.enable()
+    gc.collect()
+    print('===== 查询测试结束 =====')
@@ -0,0 +1,451 @@
+import bisect
+import random
+import sys
+import threading
+import time
+import gc
+import tracemalloc
+import pandas as pd
+
+pd.options.display.max_columns = None
+pd.options.display.max_rows = None
+pd.options.display.width = 1000
+
+
+class Node:
+    # 结点发布后不再修改, 各个版本共用没有变化的子树
+    # 同一个结点可以属于多个版本, 所以没有 parent, 修改时复制从根到该结点的路径
+    __slots__ = ('red', 'key', 'size', 'left', 'right')
+
+    def __init__(self, red: bool, left: 'Node', key, right: 'Node') -> None:
+        self.red = red
+        self.key = key
+        self.size = left.size + right.size + 1  # 以该结点为根的子树的结点数, nil 为 0
+        self.left = left
+        self.right = right
+
+    def __str__(self) -> str:
+        if self.red:
+            return f'\x1b[38;2;255;0;0m{self.key}\x1b[0m'
+        else:
+            return f'{self.key}'
+
+
+# 所有版本共用的 nil
+nil = Node.__new__(Node)
+nil.red = False
+nil.key = 'nil'
+nil.size = 0
+nil.left = nil
+nil.right = nil
+
+
+def black(node: Node) -> Node:
+    return node if not node.red else Node(False, node.left, node.key, node.right)
+
+
+def red(node: Node) -> Node:
+    return node if node.red else Node(True, node.left, node.key, node.right)
+
+
+# 以 key 连接 left 与 right, 消除 left 或 right 一侧的连续红结点
+def balance(left: Node, key, right: Node) -> Node:
+    if left.red and right.red:
+        return Node(True, black(left), key, black(right))
+    if left.red:
+        if left.left.red:
+            return Node(True, black(left.left), left.key, Node(False, left.right, key, right))
+        if left.right.red:
+            return Node(True, Node(False, left.left, left.key, left.right.left), left.right.key,
+                        Node(False, left.right.right, key, right))
+    elif right.red:
+        if right.right.red:
+            return Node(True, Node(False, left, key, right.left), right.key, black(right.right))
+        if right.left.red:
+            return Node(True, Node(False, left, key, right.left.left), right.left.key,
+                        Node(False, right.left.right, right.key, right.right))
+    return Node(False, left, key, right)
+
+
+def insert_node(node: Node, key) -> Node:
+    if node is nil:
+        return Node(True, nil, key, nil)
+    if key < node.key:
+        left = insert_node(node.left, key)
+        return Node(True, left, node.key, node.right) if node.red else balance(left, node.key, node.right)
+    else:
+        right = insert_node(node.right, key)
+        return Node(True, node.left, node.key, right) if node.red else balance(node.left, node.key, right)
+
+
+# left 的黑高比 right 少 1 时重新平衡
+def balance_left(left: Node, key, right: Node) -> Node:
+    if left.red:
+        return Node(True, black(left), key, right)
+    if not right.red:
+        return balance(left, key, red(right))
+    # right 为红, 其左孩子为黑
+    return Node(True, Node(False, left, key, right.left.left), right.left.key,
+                balance(right.left.right, right.key, red(right.right)))
+
+
+# right 的黑高比 left 少 1 时重新平衡
+def balance_right(left: Node, key, right: Node) -> Node:
+    if right.red:
+        return Node(True, left, key, black(right))
+    if not left.red:
+        return balance(red(left), key, right)
+    # left 为红, 其右孩子为黑
+    return Node(True, balance(red(left.left), left.key, left.right.left), left.right.key,
+                Node(False, left.right.right, key, right))
+
+
+# 合并被删结点的两棵子树, left 中的 key 都不大于 right 中的 key
+def fuse(left: Node, right: Node) -> Node:
+    if left is nil:
+        return right
+    if right is nil:
+        return left
+    if left.red and right.red:
+        middle = fuse(left.right, right.left)
+        if middle.red:
+            return Node(True, Node(True, left.left, left.key, middle.left), middle.key,
+                        Node(True, middle.right, right.key, right.right))
+        return Node(True, left.left, left.key, Node(True, middle, right.key, right.right))
+    if not left.red and not right.red:
+        middle = fuse(left.right, right.left)
+        if middle.red:
+            return Node(True, Node(False, left.left, left.key, middle.left), middle.key,
+                        Node(False, middle.right, right.key, right.right))
+        return balance_left(left.left, left.key, Node(False, middle, right.key, right.right))
+    if right.red:
+        return Node(True, fuse(left, right.left), right.key, right.right)
+    return Node(True, left.left, left.key, fuse(left.right, right))
+
+
+# 删除路径上遇到的第一个等于 key 的结点, 要求 key 存在
+# 从黑结点下去的一侧黑高会少 1, 由 balance_left / balance_right 补回
+def delete_node(node: Node, key) -> Node:
+    if key < node.key:
+        left = delete_node(node.left, key)
+        if node.left.red:
+            return Node(True, left, node.key, node.right)
+        return balance_left(left, node.key, node.right)
+    if node.key < key:
+        right = delete_node(node.right, key)
+        if node.right.red:
+            return Node(True, node.left, node.key, right)
+        return balance_right(node.left, node.key, right)
+    return fuse(node.left, node.right)
+
+
+class PersistentRedBlackTree:
+    """不可变的红黑树版本, insert / delete 复制路径后返回新版本, 旧版本保持不变, 读者不用加锁"""
+    __slots__ = ('root',)
+    root: Node
+
+    def __init__(self, root: Node = nil) -> None:
+        self.root = root
+
+    def insert(self, key) -> 'PersistentRedBlackTree':
+        return PersistentRedBlackTree(black(insert_node(self.root, key)))
+
+    # key 不存在时返回 self
+    def delete(self, key) -> 'PersistentRedBlackTree':
+        if self.find(key) is nil:
+            return self
+        return PersistentRedBlackTree(black(delete_node(self.root, key)))
+
+    def delete_by_index(self, index: int) -> 'PersistentRedBlackTree':
+        node = self.select_node(index)
+        if node is nil:
+            return self
+        return self.delete(node.key)
+
+    # 第一个 key >= key 的结点, 不存在返回 nil
+    def lower_bound(self, key) -> Node:
+        result = nil
+        now = self.root
+        while now is not nil:
+            if now.key < key:
+                now = now.right
+            else:
+                result = now
+                now = now.left
+        return result
+
+    # key 相等的第一个结点, 不存在返回 nil
+    def find(self, key) -> Node:
+        node = self.lower_bound(key)
+        if node is not nil and node.key == key:
+            return node
+        return nil
+
+    def __contains__(self, key) -> bool:
+        return self.find(key) is not nil
+
+    # 中序第 index 个结点 (从 0 开始), 越界返回 nil
+    def select_node(self, index: int) -> Node:
+        if index < 0 or index >= self.root.size:
+            return nil
+        now = self.root
+        while True:
+            left_size = now.left.size
+            if index < left_size:
+                now = now.left
+            elif index == left_size:
+                return now
+            else:
+                index -= left_size + 1
+                now = now.right
+
+    # 中序第 index 个 key, 越界抛出 IndexError
+    def select(self, index: int):
+        node = self.select_node(index)
+        if node is nil:
+            raise IndexError('index out of range')
+        return node.key
+
+    # 小于 key 的 key 的个数
+    def rank(self, key) -> int:
+        result = 0
+        now = self.root
+        while now is not nil:
+            if now.key < key:
+                result += now.left.size + 1
+                now = now.right
+            else:
+                now = now.left
+        return result
+
+    def __len__(self) -> int:
+        return self.root.size
+
+    # 按中序惰性产生 [lo, hi) 内的 key, 没有 parent, 用栈保存回溯路径, 栈深为 O(log(n))
+    def range(self, lo=None, hi=None):
+        stack = []
+        now = self.root
+        while now is not nil:
+            if lo is None or not now.key < lo:
+                stack.append(now)
+                now = now.left
+            else:
+                now = now.right
+        while stack:
+            node = stack.pop()
+            if hi is not None and not node.key < hi:
+                return
+            yield node.key
+            now = node.right
+            while now is not nil:
+                stack.append(now)
+                now = now.left
+
+    def __iter__(self):
+        return self.range()
+
+    # 如果正常则返回黑高，异常返回 -1
+    def check_recursive(self, node: Node, pre_node: Node) -> int:
+        if node is nil:
+            return 0
+        if node.red and (node.left.red or node.right.red):
+            return -1
+        l = self.check_recursive(node.left, pre_node)
+        if pre_node is not nil and pre_node.key > node.key:
+            return -1
+        if node.size != node.left.size + node.right.size + 1:
+            return -1
+        r = self.check_recursive(node.right, node)
+        if l == r and l != -1:
+            if node.red:
+                return l
+            else:
+                return l + 1
+        else:
+            return -1
+
+    # 检查是否满足红黑树的性质
+    def check(self) -> bool:
+        if self.root.red or nil.red or nil.size != 0:
+            return False
+        return self.check_recursive(self.root, nil) != -1
+
+    def get_str_recursive(self, node: Node, depth: int) -> str:
+        if node is nil:
+            return ''
+        l = self.get_str_recursive(node.left, depth + 1)
+        r = self.get_str_recursive(node.right, depth + 1)
+        prefix = '  ' * depth + '+~'
+        return l + prefix + f'{node}\n' + r
+
+    def __str__(self) -> str:
+        return self.get_str_recursive(self.root, 0)
+
+
+if __name__ == '__main__':
+    from RedBlackTree import RedBlackTree  # 只有加锁读者的对比测试用到
+
+    tree = PersistentRedBlackTree()
+    keys = []  # 有序的参照列表
+    history = []  # 保留部分旧版本, 最后检查它们没有被后来的修改影响
+    print('===== 正确性测试 =====')
+    for _ in range(3000):
+        if random.random() > 1 / 3 or not keys:
+            key = random.randint(0, 999)
+            print(f'\t> insert key = {key}')
+            tree = tree.insert(key)
+            bisect.insort(keys, key)
+        elif random.random() > 1 / 2:
+            key = random.randint(0, 999)
+            print(f'\t> delete key = {key}')
+            tree = tree.delete(key)
+            index = bisect.bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                keys.pop(index)
+        else:
+            index = random.randint(0, len(keys) - 1)
+            print(f'\t> delete index = {index}')
+            tree = tree.delete_by_index(index)
+            keys.pop(index)
+        assert tree.check()
+        assert list(tree) == keys and len(tree) == len(keys)
+        lo = random.randint(0, 999)
+        assert list(tree.range(lo, lo + 100)) == keys[bisect.bisect_left(keys, lo):bisect.bisect_left(keys, lo + 100)]
+        if random.random() < 0.1:
+            history.append((tree, list(keys)))
+    for version, version_keys in history:
+        assert version.check() and list(version) == version_keys
+    print('===== 正确性测试通过 =====')
+    print()
+    print('===== 内存测试 =====')
+    # 保留每个版本时, 每次修改新增的内存约为 O(log(n)) 个结点
+    gc.disable()
+    for k in (10, 16, 20):
+        n = 2 ** k
+        tree = PersistentRedBlackTree()
+        for _ in range(n):
+            tree = tree.insert(random.random())
+        versions = [tree]
+        tracemalloc.start()
+        for _ in range(10000):
+            versions.append(versions[-1].insert(random.random()))
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f'n=2^{k}, memory per update = {memory / 10000:.0f} B = {memory / 10000 / sys.getsizeof(tree.root):.1f} nodes')
+        del versions, tree
+    gc.enable()
+    gc.collect()
+    print('===== 内存测试结束 =====')
+    print()
+    print('===== 性能测试 =====')
+    k_list = list(range(1, 21, 1))
+    time_cost = pd.DataFrame(
+        index=pd.Index(data=[f'2^{k}' for k in k_list], name='n=2^k'),
+        columns=pd.Index(['total insert cost', 'total delete cost',
+                          'insert cost / lg(n)', 'delete cost / lg(n)']),
+        dtype=float
+    )
+    gc.disable()  # 避免 gc 造成性能波动
+    tree = PersistentRedBlackTree()
+    last_n = 0
+    for k in k_list:
+        n = 2 ** k
+        delta = n - last_n
+        last_n = n
+        for _ in range(delta):
+            tree = tree.insert(random.randint(0, 999))
+        insert_sum_time = 0
+        delete_sum_time = 0
+        repeat_times = 10000
+        for _ in range(repeat_times):
+            key = random.randint(0, 999)
+            start = time.time()
+            tree = tree.insert(key)
+            end = time.time()
+            insert_sum_time += end - start
+            start = time.time()
+            tree = tree.delete(key)
+            end = time.time()
+            delete_sum_time += end - start
+        print(f'n=2^{k}\n\tinsert cost sum = {insert_sum_time} s\n\tdelete cost sum = {delete_sum_time} s')
+        time_cost.loc[f'2^{k}', 'total insert cost'] = insert_sum_time
+        time_cost.loc[f'2^{k}', 'total delete cost'] = delete_sum_time
+        time_cost.loc[f'2^{k}', 'insert cost / lg(n)'] = insert_sum_time / k * 100
+        time_cost.loc[f'2^{k}', 'delete cost / lg(n)'] = delete_sum_time / k * 100
+    print(time_cost)
+    gc.enable()
+    gc.collect()
+    print('===== 性能测试结束 =====')
+    print()
+    print('===== 并发读测试 =====')
+    # 读线程反复取当前版本做区间扫描, 写线程不断发布新版本, 读者不加锁且每次读到的都是一致的快照
+    # 对照组为原地修改的 RedBlackTree, 读写都要持有同一把锁
+    n = 2 ** 16
+    tree = PersistentRedBlackTree()
+    locked_tree = RedBlackTree()
+    for _ in range(n):
+        key = random.randint(0, 999)
+        tree = tree.insert(key)
+        locked_tree.insert(key)
+    lock = threading.Lock()
+    duration = 2
+    read_cost = pd.DataFrame(
+        index=pd.Index(data=[1, 2, 4], name='readers'),
+        columns=pd.Index(['reads/s without writer', 'reads/s with writer', 'writes/s',
+                          'locked reads/s with writer', 'locked writes/s']),
+        dtype=float
+    )
+
+    def read(i: int):
+        while not stop.is_set():
+            version = tree  # 读取引用是原子的, 之后的遍历只看这个版本
+            lo = random.randint(0, 999)
+            scanned = list(version.range(lo, lo + 10))
+            assert scanned == sorted(scanned) and len(scanned) == version.rank(lo + 10) - version.rank(lo)
+            reads[i] += 1
+
+    def write():
+        global tree
+        while not stop.is_set():
+            tree = tree.insert(random.randint(0, 999)).delete_by_index(random.randint(0, n - 1))
+            writes[0] += 1
+
+    def locked_read(i: int):
+        while not stop.is_set():
+            lo = random.randint(0, 999)
+            with lock:
+                scanned = list(locked_tree.range(lo, lo + 10))
+            reads[i] += 1
+
+    def locked_write():
+        while not stop.is_set():
+            with lock:
+                locked_tree.insert(random.randint(0, 999))
+                locked_tree.delete_by_index(random.randint(0, n - 1))
+            writes[0] += 1
+
+    for reader, writer, column in ((read, None, 'reads/s without writer'),
+                                   (read, write, 'reads/s with writer'),
+                                   (locked_read, locked_write, 'locked reads/s with writer')):
+        for readers in read_cost.index:
+            stop = threading.Event()
+            reads = [0] * readers
+            writes = [0]
+            threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+            if writer is not None:
+                threads.append(threading.Thread(target=writer))
+            for thread in threads:
+                thread.start()
+            time.sleep(duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            read_cost.loc[readers, column] = sum(reads) / duration
+            if writer is write:
+                read_cost.loc[readers, 'writes/s'] = writes[0] / duration
+            elif writer is locked_write:
+                read_cost.loc[readers, 'locked writes/s'] = writes[0] / duration
+    print(read_cost)
+    assert tree.check() and len(tree) == n
+    assert locked_tree.check() and len(locked_tree) == n
+    print('===== 并发读测试结束 =====')
@@ -1,6 +1,9 @@
+import bisect
+import itertools
 import random
 import time
 import gc
+import tracemalloc
 from typing import Tuple
 from enum import Enum, unique
 import pandas as pd
@@ -17,84 +20,55 @@ class Color(Enum):
 
 
 class Node:
+    # 用 __slots__ 存放普通属性, 不建 __dict__, 也不经过 property 检查, 颜色用 bool 表示 (red)
+    __slots__ = ('red', 'key', 'count', 'size', 'parent', 'left', 'right')
 
+    # 兼容旧接口, 以 Color 读写颜色
     @property
-    def color(self):
-        return self.__color
+    def color(self) -> Color:
+        return Color.Red if self.red else Color.Black
 
     @color.setter
-    def color(self, value):
+    def color(self, value: Color):
         if not isinstance(value, Color):
             raise TypeError("'color' must be instance of 'Color'")
-        self.__color = value
-
-    @property
-    def key(self):
-        return self.__key
-
-    @key.setter
-    def key(self, value):
-        self.__key = value
-
-    @property
-    def parent(self):
-        assert self.__parent is not None
-        return self.__parent
-
-    @parent.setter
-    def parent(self, value):
-        if not isinstance(value, Node):
-            raise TypeError("'parent' must be instance of 'Node'")
-        self.__parent = value
-
-    @property
-    def left(self):
-        assert self.__left is not None
-        return self.__left
-
-    @left.setter
-    def left(self, value):
-        if not isinstance(value, Node):
-            raise TypeError("'left' must be instance of 'Node'")
-        self.__left = value
-
-    @property
-    def right(self):
-        assert self.__right is not None
-        return self.__right
-
-    @right.setter
-    def right(self, value):
-        if not isinstance(value, Node):
-            raise TypeError("'right' must be instance of 'Node'")
-        self.__right = value
+        self.red = value is Color.Red
 
     def __init__(self, color: Color, key, parent=None, left=None, right=None) -> None:
-        self.color = color
+        self.red = color is Color.Red
         self.key = key
-        if parent is not None:
-            self.parent = parent
-        if left is not None:
-            self.left = left
-        if right is not None:
-            self.right = right
+        self.count = 1  # key 的重数, 只有多重集合模式下才会大于 1
+        self.size = 1  # 以该结点为根的子树的 key 的个数 (计入重数), nil 为 0
+        self.parent = parent
+        self.left = left
+        self.right = right
 
     def __str__(self) -> str:
-        if self.color == Color.Red:
-            return f'\x1b[38;2;255;0;0m{self.key}\x1b[0m'
+        text = f'{self.key}' if self.count == 1 else f'{self.key}*{self.count}'
+        if self.red:
+            return f'\x1b[38;2;255;0;0m{text}\x1b[0m'
         else:
-            return f'{self.key}'
+            return text
+
+
+# union 中较小一侧不超过该结点数时改为逐个插入
+UNION_CUTOFF = 32
 
 
 class RedBlackTree:
     nil: Node
     root: Node
+    # 多重集合模式: 相同的 key 只占一个结点, 用 count 记录重数
+    multiset: bool
 
-    def __init__(self) -> None:
+    def __init__(self, multiset: bool = False) -> None:
+        self.multiset = multiset
         self.clear()
 
     def clear(self):
         self.nil = Node(Color.Black, 'nil')
+        self.nil.count = 0
+        self.nil.size = 0
         self.nil.parent = self.nil
         self.nil.left = self.nil
         self.nil.right = self.nil
@@ -125,6 +99,9 @@ class RedBlackTree:
             x.parent.right = y
         y.left = x
         x.parent = y
+        # 修正 size
+        y.size = x.size
+        x.size = x.left.size + x.right.size + x.count
 
     def right_rotate(self, node: Node):
         y = node
@@ -141,56 +118,67 @@ class RedBlackTree:
             y.parent.right = x
         x.right = y
         y.parent = x
+        # 修正 size
+        x.size = y.size
+        y.size = y.left.size + y.right.size + y.count
 
     def insert(self, key):
         z = Node(Color.Red, key, self.nil, self.nil, self.nil)
         self.insert_node(z)
 
-    # 修正 insert 之后的颜色问题
-    def insert_fixup(self, node: Node):
+    # 修正 insert 之后的颜色问题, 返回根是否被染红过 (染回黑后黑高加一)
+    def insert_fixup(self, node: Node) -> bool:
         z = node
         # z 的颜色为 红，父节点不能是红
-        while z.parent.color == Color.Red:
+        while z.parent.red:
             if z.parent is z.parent.parent.left:
                 y = z.parent.parent.right
-                if y.color == Color.Red:  # case 1
-                    z.parent.color = Color.Black
-                    y.color = Color.Black
-                    z.parent.parent.color = Color.Red
+                if y.red:  # case 1
+                    z.parent.red = False
+                    y.red = False
+                    z.parent.parent.red = True
                     z = z.parent.parent
                 else:
                     if z is z.parent.right:  # case 2
                         z = z.parent
                         self.left_rotate(z)
-                    z.parent.color = Color.Black  # case 3
-                    z.parent.parent.color = Color.Red
+                    z.parent.red = False  # case 3
+                    z.parent.parent.red = True
                     self.right_rotate(z.parent.parent)
             else:
                 y = z.parent.parent.left
-                if y.color == Color.Red:  # case 4
-                    z.parent.color = Color.Black
-                    y.color = Color.Black
-                    z.parent.parent.color = Color.Red
+                if y.red:  # case 4
+                    z.parent.red = False
+                    y.red = False
+                    z.parent.parent.red = True
                     z = z.parent.parent
                 else:
                     if z is z.parent.left:  # case 5
                         z = z.parent
                         self.right_rotate(z)
-                    z.parent.color = Color.Black  # case 6
-                    z.parent.parent.color = Color.Red
+                    z.parent.red = False  # case 6
+                    z.parent.parent.red = True
                     self.left_rotate(z.parent.parent)
-        self.root.color = Color.Black
+        grown = self.root.red
+        self.root.red = False
+        return grown
 
-    def insert_node(self, node: Node):
+    # 返回黑高是否增加; 多重集合模式下遇到相同的 key 只增加重数, 不用调整
+    def insert_node(self, node: Node) -> bool:
         node.left = self.nil
         node.right = self.nil
-        node.color = Color.Red
+        node.red = True
+        node.size = node.count
         now = self.root  # 当前查找结点
-        pre = now.parent  # 当前节点的父节点, 引入 pre 的作用在于 nil.parent 无定义
+        pre = self.nil  # 当前节点的父节点, 引入 pre 的作用在于 nil.parent 无定义 (split 出的树共用 nil)
         while now is not self.nil:
             pre = now
+            now.size += node.count  # 路径上每个子树都多了 node
             if node.key < now.key:
                 now = now.left
+            elif self.multiset and node.key == now.key:
+                now.count += node.count
+                return False
             else:
                 now = now.right
         # 查找到 node 的插入位置
@@ -203,7 +191,7 @@ class RedBlackTree:
             pre.left = node
         else:
             pre.right = node
-        self.insert_fixup(node)
+        return self.insert_fixup(node)
 
     def delete(self, key):
         if self.root is self.nil:
@@ -211,7 +199,7 @@ class RedBlackTree:
         now = self.root
         while now is not self.nil:
             if key == now.key:
-                self.delete_node(now)
+                self.delete_one(now)
                 return
             elif key < now.key:
                 now = now.left
@@ -220,51 +208,62 @@ class RedBlackTree:
 
     def delete_fixup(self, node: Node):
         x = node
-        while x is not self.root and x.color == Color.Black:
+        while x is not self.root and not x.red:
             if x is x.parent.left:
                 w = x.parent.right
-                if w.color == Color.Red:
-                    w.color = Color.Black
-                    x.parent.color = Color.Red
+                if w.red:
+                    w.red = False
+                    x.parent.red = True
                     self.left_rotate(x.parent)
                     w = x.parent.right
-                if w.left.color == Color.Black and w.right.color == Color.Black:
-                    w.color = Color.Red
+                if not w.left.red and not w.right.red:
+                    w.red = True
                     x = x.parent
                 else:
-                    if w.right.color == Color.Black:
-                        w.left.color = Color.Black
-                        w.color = Color.Red
+                    if not w.right.red:
+                        w.left.red = False
+                        w.red = True
                         self.right_rotate(w)
                         w = x.parent.right
-                    w.color = x.parent.color
-                    x.parent.color = Color.Black
-                    w.right.color = Color.Black
+                    w.red = x.parent.red
+                    x.parent.red = False
+                    w.right.red = False
                     self.left_rotate(x.parent)
                     x = self.root
             else:
                 w = x.parent.left
-                if w.color == Color.Red:
-                    w.color = Color.Black
-                    x.parent.color = Color.Red
+                if w.red:
+                    w.red = False
+                    x.parent.red = True
                     self.right_rotate(x.parent)
                     w = x.parent.left
-                if w.left.color == Color.Black and w.right.color == Color.Black:
-                    w.color = Color.Red
+                if not w.left.red and not w.right.red:
+                    w.red = True
                     x = x.parent
                 else:
-                    if w.left.color == Color.Black:
-                        w.right.color = Color.Black
-                        w.color = Color.Red
+                    if not w.left.red:
+                        w.right.red = False
+                        w.red = True
                         self.left_rotate(w)
                         w = x.parent.left
-                    w.color = x.parent.color
-                    x.parent.color = Color.Black
-                    w.left.color = Color.Black
+                    w.red = x.parent.red
+                    x.parent.red = False
+                    w.left.red = False
                     self.right_rotate(x.parent)
                     x = self.root
-        x.color = Color.Black
+        x.red = False
 
+    # 删除结点上的一个 key, 重数大于 1 时只减少重数, 不用调整
+    def delete_one(self, node: Node):
+        if node.count == 1:
+            self.delete_node(node)
+            return
+        node.count -= 1
+        while node is not self.nil:
+            node.size -= 1
+            node = node.parent
+
+    # 删除整个结点 (连同所有重数)
     def delete_node(self, node: Node):
         z = node
         if z.left is self.nil or z.right is self.nil:  # case 1, 2
@@ -276,31 +275,62 @@ class RedBlackTree:
         else:
             x = y.right
         self.transplant(y, x)
+        removed = z.count
         if y is not z:  # case 3
             z.key = y.key
-        if y.color == Color.Black:  # 删除黑节点需要 fixup
+            z.count = y.count
+        # y 到 z 之间的子树少了 y 的重数, z 到根的子树少了 z 原来的重数
+        now = x.parent
+        delta = y.count
+        while now is not self.nil:
+            if now is z:
+                delta = removed
+            now.size -= delta
+            now = now.parent
+        if not y.red:  # 删除黑节点需要 fixup
             self.delete_fixup(x)
 
-    def find_by_index_recursive(self, now: Node, index: int) -> Tuple[Node, int]:
-        if now is self.nil:
-            return self.nil, index
-        l, index = self.find_by_index_recursive(now.left, index)
-        if l is not self.nil:
-            return l, index
-        if index == 0:
-            return now, index
-        index -= 1
-        r, index = self.find_by_index_recursive(now.right, index)
-        if r is not self.nil:
-            return r, index
-        return self.nil, index
+    # 中序第 index 个结点 (从 0 开始), 越界返回 nil
+    def select_node(self, index: int) -> Node:
+        if index < 0 or index >= self.root.size:
+            return self.nil
+        now = self.root
+        while True:
+            left_size = now.left.size
+            if index < left_size:
+                now = now.left
+            elif index < left_size + now.count:
+                return now
+            else:
+                index -= left_size + now.count
+                now = now.right
+
+    # 中序第 index 个 key, 越界抛出 IndexError
+    def select(self, index: int):
+        node = self.select_node(index)
+        if node is self.nil:
+            raise IndexError('index out of range')
+        return node.key
+
+    # 小于 key 的 key 的个数, 即 key 第一次出现的位置
+    def rank(self, key) -> int:
+        result = 0
+        now = self.root
+        while now is not self.nil:
+            if now.key < key:
+                result += now.left.size + now.count
+                now = now.right
+            else:
+                now = now.left
+        return result
+
+    def __len__(self) -> int:
+        return self.root.size
 
     def delete_by_index(self, index: int):
-        if index < 0:
-            return
-        node, _ = self.find_by_index_recursive(self.root, index)
+        node = self.select_node(index)
         if node is not self.nil:
-            self.delete_node(node)
+            self.delete_one(node)
 
     def min_node(self, sub_root: Node):
         if sub_root is self.nil:
@@ -310,22 +340,417 @@ class RedBlackTree:
             now = now.left
         return now
 
+    def max_node(self, sub_root: Node):
+        if sub_root is self.nil:
+            return self.nil
+        now = sub_root
+        while now.right is not self.nil:
+            now = now.right
+        return now
+
+    # 中序后继, 没有右子树时沿父指针向上, 直到从左子树上来
+    def successor(self, node: Node) -> Node:
+        if node.right is not self.nil:
+            return self.min_node(node.right)
+        pre = node.parent
+        while pre is not self.nil and node is pre.right:
+            node = pre
+            pre = pre.parent
+        return pre
+
+    # 中序前驱, 与 successor 对称
+    def predecessor(self, node: Node) -> Node:
+        if node.left is not self.nil:
+            return self.max_node(node.left)
+        pre = node.parent
+        while pre is not self.nil and node is pre.left:
+            node = pre
+            pre = pre.parent
+        return pre
+
+    # 第一个 key >= key 的结点, 不存在返回 nil
+    def lower_bound(self, key) -> Node:
+        result = self.nil
+        now = self.root
+        while now is not self.nil:
+            if now.key < key:
+                now = now.right
+            else:
+                result = now
+                now = now.left
+        return result
+
+    # 第一个 key > key 的结点, 不存在返回 nil
+    def upper_bound(self, key) -> Node:
+        result = self.nil
+        now = self.root
+        while now is not self.nil:
+            if key < now.key:
+                result = now
+                now = now.left
+            else:
+                now = now.right
+        return result
+
+    # key 相等的第一个结点, 不存在返回 nil
+    def find(self, key) -> Node:
+        node = self.lower_bound(key)
+        if node is not self.nil and node.key == key:
+            return node
+        return self.nil
+
+    def __contains__(self, key) -> bool:
+        return self.find(key) is not self.nil
+
+    # key 出现的次数
+    def count(self, key) -> int:
+        result = 0
+        now = self.lower_bound(key)
+        while now is not self.nil and not key < now.key:
+            result += now.count
+            now = self.successor(now)
+        return result
+
+    # 按中序惰性产生 [lo, hi) 内的 key, 重复的 key 按重数产生多次, 不递归也不建中间列表, O(log(n) + k)
+    # 遍历过程中不能修改树
+    def range(self, lo=None, hi=None):
+        now = self.min_node(self.root) if lo is None else self.lower_bound(lo)
+        while now is not self.nil and (hi is None or now.key < hi):
+            for _ in range(now.count):
+                yield now.key
+            now = self.successor(now)
+
+    def __iter__(self):
+        return self.range()
+
+    def __reversed__(self):
+        now = self.max_node(self.root)
+        while now is not self.nil:
+            for _ in range(now.count):
+                yield now.key
+            now = self.predecessor(now)
+
+    # 以 node 为根的子树的黑高 (含 node 自身, 不含 nil)
+    def black_height(self, node: Node) -> int:
+        height = 0
+        while node is not self.nil:
+            height += not node.red
+            node = node.left
+        return height
+
+    # 把子树从父结点上摘下作为独立的树, 根染黑, 返回 (根, 黑高)
+    def detach(self, node: Node, height: int) -> Tuple[Node, int]:
+        if node is not self.nil:
+            node.parent = self.nil
+            if node.red:
+                node.red = False
+                height += 1
+        return node, height
+
+    # 以下 join / split 系列在共用 nil 的子树上操作, 子树用 (黑根, 黑高) 表示, 黑高沿递归传递不必重算
+    # 借用 self.root 让旋转与 insert_fixup 作用在子树上, 由调用者在最后恢复 self.root
+
+    # 以 k 连接 left 与 right, 要求 left 中的 key <= k.key <= right 中的 key
+    # 沿较高一侧的内侧链向下找到黑高相同的黑结点, 挂上红色的 k 后做 insert_fixup, O(|lh - rh| + 1)
+    def join_node(self, left: Node, lh: int, k: Node, right: Node, rh: int) -> Tuple[Node, int]:
+        if lh == rh:
+            k.red = False
+            k.left = left
+            k.right = right
+            parent = self.nil
+        else:
+            k.red = True
+            parent = self.nil
+            if lh > rh:
+                now = left
+                height = lh
+                while now.red or height > rh:
+                    height -= not now.red
+                    now.size += right.size + k.count  # 路径上每个子树都多了 k 与 right
+                    parent = now
+                    now = now.right
+                parent.right = k
+                k.left = now
+                k.right = right
+            else:
+                now = right
+                height = rh
+                while now.red or height > lh:
+                    height -= not now.red
+                    now.size += left.size + k.count
+                    parent = now
+                    now = now.left
+                parent.left = k
+                k.left = left
+                k.right = now
+        k.parent = parent
+        if k.left is not self.nil:
+            k.left.parent = k
+        if k.right is not self.nil:
+            k.right.parent = k
+        k.size = k.left.size + k.right.size + k.count
+        if parent is self.nil:
+            return k, lh + 1
+        self.root = left if lh > rh else right
+        grown = self.insert_fixup(k)
+        return self.root, max(lh, rh) + grown
+
+    # 按 key 把子树拆成 key 小于 key 与不小于 key 的两棵, 返回 (左根, 左黑高, 右根, 右黑高, 是否含 key)
+    def split_node(self, node: Node, height: int, key) -> Tuple[Node, int, Node, int, bool]:
+        if node is self.nil:
+            return self.nil, 0, self.nil, 0, False
+        child_height = height - (not node.red)
+        left, lh = self.detach(node.left, child_height)
+        right, rh = self.detach(node.right, child_height)
+        if node.key < key:
+            l, l_height, r, r_height, found = self.split_node(right, rh, key)
+            l, l_height = self.join_node(left, lh, node, l, l_height)
+        else:
+            l, l_height, r, r_height, found = self.split_node(left, lh, key)
+            r, r_height = self.join_node(r, r_height, node, right, rh)
+            found = found or node.key == key
+        return l, l_height, r, r_height, found
+
+    # 摘下最大的结点, 返回 (其余部分的根, 黑高, 最大结点)
+    def split_last(self, node: Node, height: int) -> Tuple[Node, int, Node]:
+        child_height = height - (not node.red)
+        left, lh = self.detach(node.left, child_height)
+        right, rh = self.detach(node.right, child_height)
+        if right is self.nil:
+            return left, lh, node
+        rest, rest_height, last = self.split_last(right, rh)
+        rest, rest_height = self.join_node(left, lh, node, rest, rest_height)
+        return rest, rest_height, last
+
+    # 摘下最小的结点, 返回 (其余部分的根, 黑高, 最小结点)
+    def split_first(self, node: Node, height: int) -> Tuple[Node, int, Node]:
+        child_height = height - (not node.red)
+        left, lh = self.detach(node.left, child_height)
+        right, rh = self.detach(node.right, child_height)
+        if left is self.nil:
+            return right, rh, node
+        rest, rest_height, first = self.split_first(left, lh)
+        rest, rest_height = self.join_node(rest, rest_height, node, right, rh)
+        return rest, rest_height, first
+
+    # 没有中间结点的连接, 借用 left 的最大结点作为 k
+    def join2(self, left: Node, lh: int, right: Node, rh: int) -> Tuple[Node, int]:
+        if left is self.nil:
+            return right, rh
+        left, lh, last = self.split_last(left, lh)
+        return self.join_node(left, lh, last, right, rh)
+
+    # 以较小一棵 a 的根拆分 b, 两侧递归合并后再以 a 的根连接, O(m log(n / m + 1))
+    # 两侧的递归互不相干, 可以并行
+    def union_node(self, a: Node, ah: int, b: Node, bh: int) -> Tuple[Node, int]:
+        if a.size > b.size:
+            a, ah, b, bh = b, bh, a, ah
+        if a is self.nil:
+            return b, bh
+        if a.size <= UNION_CUTOFF:
+            # a 很小时逐个插入比拆分 b 的常数小
+            nodes = [a]
+            for node in nodes:
+                if node.left is not self.nil:
+                    nodes.append(node.left)
+                if node.right is not self.nil:
+                    nodes.append(node.right)
+            for node in nodes:
+                self.root = b
+                bh += self.insert_node(node)
+                b = self.root
+            return b, bh
+        child_height = ah - (not a.red)
+        left, lh = self.detach(a.left, child_height)
+        right, rh = self.detach(a.right, child_height)
+        bl, bl_height, br, br_height, found = self.split_node(b, bh, a.key)
+        if found and self.multiset:
+            # 多重集合模式下 b 中至多一个结点等于 a.key, 即 br 的最小结点, 合并到 a 上
+            br, br_height, first = self.split_first(br, br_height)
+            a.count += first.count
+        l, l_height = self.union_node(left, lh, bl, bl_height)
+        r, r_height = self.union_node(right, rh, br, br_height)
+        return self.join_node(l, l_height, a, r, r_height)
+
+    # 保留 a 中在 b 里出现过的 key
+    # 旋转后 a 的左子树里也可能有等于 a.key 的结点, 而拆给左侧的 b 只含小于 a.key 的 key,
+    # 所以用 keep 记录子树的上界 key 是否出现在 b 中, 没有则为 None
+    def intersection_node(self, a: Node, ah: int, b: Node, bh: int, keep) -> Tuple[Node, int]:
+        if a is self.nil or (b is self.nil and keep is None):
+            return self.nil, 0
+        if b is self.nil:
+            # a 中的 key 都不大于 keep, 只留下等于 keep 的部分
+            _, _, r, r_height, _ = self.split_node(a, ah, keep)
+            return r, r_height
+        child_height = ah - (not a.red)
+        left, lh = self.detach(a.left, child_height)
+        right, rh = self.detach(a.right, child_height)
+        bl, bl_height, br, br_height, found = self.split_node(b, bh, a.key)
+        found = found or (keep is not None and keep == a.key)
+        l, l_height = self.intersection_node(left, lh, bl, bl_height, a.key if found else None)
+        r, r_height = self.intersection_node(right, rh, br, br_height, keep)
+        if found:
+            return self.join_node(l, l_height, a, r, r_height)
+        return self.join2(l, l_height, r, r_height)
+
+    # 去掉 a 中在 b 里出现过的 key, drop 的含义与 intersection_node 的 keep 相同
+    def difference_node(self, a: Node, ah: int, b: Node, bh: int, drop) -> Tuple[Node, int]:
+        if a is self.nil:
+            return self.nil, 0
+        if b is self.nil:
+            if drop is None:
+                return a, ah
+            l, l_height, _, _, _ = self.split_node(a, ah, drop)
+            return l, l_height
+        child_height = ah - (not a.red)
+        left, lh = self.detach(a.left, child_height)
+        right, rh = self.detach(a.right, child_height)
+        bl, bl_height, br, br_height, found = self.split_node(b, bh, a.key)
+        found = found or (drop is not None and drop == a.key)
+        l, l_height = self.difference_node(left, lh, bl, bl_height, a.key if found else None)
+        r, r_height = self.difference_node(right, rh, br, br_height, drop)
+        if found:
+            return self.join2(l, l_height, r, r_height)
+        return self.join_node(l, l_height, a, r, r_height)
+
+    # 由有序的 (key, count) 列表的 [lo, hi) 段建出完全平衡的子树, 只有深度为 red_depth 的结点为红
+    def build_node(self, items: list, lo: int, hi: int, parent: Node, depth: int, red_depth: int) -> Node:
+        if lo >= hi:
+            return self.nil
+        mid = (lo + hi) // 2
+        key, count = items[mid]
+        node = Node(Color.Black, key, parent, self.nil, self.nil)
+        node.red = depth == red_depth
+        node.count = count
+        node.left = self.build_node(items, lo, mid, node, depth + 1, red_depth)
+        node.right = self.build_node(items, mid + 1, hi, node, depth + 1, red_depth)
+        node.size = node.left.size + node.right.size + count
+        return node
+
+    # O(n) 批量建树, 输入无序时先排序, O(n log(n))
+    # 左右子树结点数至多差 1, 叶子的深度只差 1, 把最深一层染红即满足黑高相等
+    @classmethod
+    def from_sorted(cls, iterable, multiset: bool = False) -> 'RedBlackTree':
+        keys = list(iterable)
+        if any(a > b for a, b in zip(keys, keys[1:])):
+            keys.sort()
+        if multiset:
+            items = [(key, len(list(group))) for key, group in itertools.groupby(keys)]
+        else:
+            items = [(key, 1) for key in keys]
+        tree = cls(multiset)
+        n = len(items)
+        red_depth = n.bit_length() - 1 if n > 1 else -1  # 只有一个结点时根必须为黑
+        tree.root = tree.build_node(items, 0, n, tree.nil, 0, red_depth)
+        return tree
+
+    # 让 other 与 self 共用 nil, 只改写较小的一棵树中指向 nil 的指针, O(min(n, m))
+    def share_nil(self, other: 'RedBlackTree'):
+        if other is self:
+            raise ValueError('other must be a different tree')
+        if other.multiset != self.multiset:
+            raise ValueError('other must be in the same multiset mode')
+        if self.nil is other.nil:
+            return
+        small, large = (self, other) if len(self) < len(other) else (other, self)
+        old = small.nil
+        if small.root is old:
+            small.root = large.nil
+        else:
+            small.root.parent = large.nil
+            stack = [small.root]
+            while stack:
+                node = stack.pop()
+                if node.left is old:
+                    node.left = large.nil
+                else:
+                    stack.append(node.left)
+                if node.right is old:
+                    node.right = large.nil
+                else:
+                    stack.append(node.right)
+        small.nil = large.nil
+
+    # 把 other 接在 self 之后, 要求 other 中的 key 都不小于 self 中的 key, other 被清空
+    def join(self, other: 'RedBlackTree'):
+        # 先检查, 再修改两棵树
+        if other is self:
+            raise ValueError('other must be a different tree')
+        if other.multiset != self.multiset:
+            raise ValueError('other must be in the same multiset mode')
+        if other.root is other.nil:
+            return
+        if self.root is not self.nil:
+            last = self.max_node(self.root)
+            first = other.min_node(other.root)
+            if first.key < last.key:
+                raise ValueError('keys of other must not be less than keys of self')
+            if self.multiset and first.key == last.key:
+                # 多重集合模式下相接处的相同 key 合并到 self 的结点上
+                count = first.count
+                other.delete_node(first)
+                last.count += count
+                while last is not self.nil:
+                    last.size += count
+                    last = last.parent
+                if other.root is other.nil:
+                    return
+        self.share_nil(other)
+        self.root, _ = self.join2(self.root, self.black_height(self.root), other.root, other.black_height(other.root))
+        self.root.parent = self.nil  # 树为空时 root 即 nil, 保持 nil.parent 为 nil
+        other.clear()
+
+    # self 留下小于 key 的部分, 返回不小于 key 的部分, 两棵树共用 nil, O(log(n))
+    def split(self, key) -> 'RedBlackTree':
+        l, _, r, _, _ = self.split_node(self.root, self.black_height(self.root), key)
+        self.root = l
+        result = RedBlackTree(self.multiset)
+        result.nil = self.nil
+        result.root = r
+        self.nil.parent = self.nil
+        return result
+
+    # 以下集合运算都原地修改 self 并清空 other, 重复的 key 按多重集合处理:
+    # union 保留两边所有的 key, intersection / difference 按 key 是否出现在 other 中筛选 self
+    def union(self, other: 'RedBlackTree'):
+        self.share_nil(other)
+        self.root, _ = self.union_node(self.root, self.black_height(self.root),
+                                       other.root, other.black_height(other.root))
+        self.root.parent = self.nil
+        other.clear()
+
+    def intersection(self, other: 'RedBlackTree'):
+        self.share_nil(other)
+        self.root, _ = self.intersection_node(self.root, self.black_height(self.root),
+                                              other.root, other.black_height(other.root), None)
+        self.root.parent = self.nil
+        other.clear()
+
+    def difference(self, other: 'RedBlackTree'):
+        self.share_nil(other)
+        self.root, _ = self.difference_node(self.root, self.black_height(self.root),
+                                            other.root, other.black_height(other.root), None)
+        self.root.parent = self.nil
+        other.clear()
+
     # 如果正常则返回黑高，异常返回 -1
     def check_recursive(self, node: Node, pre_node: Node) -> int:
         if node is self.nil:
             return 0
-        if node.color == Color.Red and (node.left.color == Color.Red or node.right.color == Color.Red):
+        if node.red and (node.left.red or node.right.red):
             return -1
         l = self.check_recursive(node.left, pre_node)
-        if pre_node is not self.nil and pre_node.key > node.key:
+        if pre_node is not self.nil and (pre_node.key > node.key or self.multiset and pre_node.key == node.key):
             return -1
         if node.left is not self.nil and node.left.parent is not node:
             return -1
         if node.right is not self.nil and node.right.parent is not node:
             return -1
+        if node.count < 1 or node.size != node.left.size + node.right.size + node.count:
+            return -1
         r = self.check_recursive(node.right, node)
         if l == r and l != -1:
-            if node.color == Color.Red:
+            if node.red:
                 return l
             else:
                 return l + 1
@@ -334,7 +759,9 @@ class RedBlackTree:
 
     # 检查是否满足红黑树的性质
     def check(self) -> bool:
-        if self.root.parent is not self.nil or self.root.color != Color.Black or self.nil.color != Color.Black:
+        if self.root.parent is not self.nil or self.root.red or self.nil.red:
+            return False
+        if self.nil.size != 0 or self.nil.count != 0:
             return False
         return self.check_recursive(self.root, self.nil) != -1
 
@@ -351,61 +778,295 @@ class RedBlackTree:
 
 
 if __name__ == '__main__':
-    tree = RedBlackTree()
-    n = 0
+    from BPlusTree import BPlusTree  # 只有性能测试对比时用到
+
     print('===== 正确性测试 =====')
-    for _ in range(1000):
-        if random.random() > 1 / 3 or n <= 0:
-            key = random.randint(0, 999)
-            print(f'\t> insert key = {key}')
-            tree.insert(key)
-            n += 1
-            # print(tree)
-        else:
-            index = random.randint(0, n - 1)
-            print(f'\t> delete index = {index}')
-            tree.delete_by_index(index)
-            n -= 1
-            # print(tree)
-        assert tree.check()
+    for multiset in (False, True):
+        tree = RedBlackTree(multiset)
+        n = 0
+        keys = []  # 有序的参照列表
+        for _ in range(1000):
+            if random.random() > 1 / 3 or n <= 0:
+                key = random.randint(0, 999)
+                print(f'\t> insert key = {key}')
+                tree.insert(key)
+                bisect.insort(keys, key)
+                n += 1
+                # print(tree)
+            elif random.random() > 1 / 2:
+                index = random.randint(0, n - 1)
+                key = tree.select(index)
+                print(f'\t> select index = {index}, key = {key}')
+                assert tree.rank(key) <= index < tree.rank(key + 1)
+                assert tree.count(key) == keys.count(key)
+            elif random.random() > 1 / 2:
+                lo = random.randint(0, 999)
+                hi = lo + random.randint(0, 99)
+                print(f'\t> range [{lo}, {hi})')
+                assert list(tree.range(lo, hi)) == keys[bisect.bisect_left(keys, lo):bisect.bisect_left(keys, hi)]
+                assert (lo in tree) == (lo in keys)
+                node = tree.upper_bound(lo)
+                index = bisect.bisect_right(keys, lo)
+                assert (node is tree.nil) if index == n else (node.key == keys[index])
+            else:
+                index = random.randint(0, n - 1)
+                print(f'\t> delete index = {index}')
+                tree.delete_by_index(index)
+                keys.pop(index)
+                n -= 1
+                # print(tree)
+            assert tree.check()
+            assert list(tree) == keys and list(reversed(tree)) == keys[::-1]
+        # 集合运算, 与列表上的结果对照
+        for _ in range(300):
+            other_keys = sorted(random.randint(0, 999) for _ in range(random.randint(0, 500)))
+            other = RedBlackTree(multiset)
+            for key in other_keys:
+                other.insert(key)
+            operation = random.choice(['union', 'intersection', 'difference', 'split'])
+            print(f'\t> {operation} with {len(other_keys)} keys')
+            if operation == 'union':
+                tree.union(other)
+                keys = sorted(keys + other_keys)
+            elif operation == 'intersection':
+                tree.intersection(other)
+                keys = [key for key in keys if key in set(other_keys)]
+            elif operation == 'difference':
+                tree.difference(other)
+                keys = [key for key in keys if key not in set(other_keys)]
+            else:
+                key = random.randint(0, 999)
+                other = tree.split(key)
+                assert other.check() and list(other) == keys[bisect.bisect_left(keys, key):]
+                assert tree.check() and list(tree) == keys[:bisect.bisect_left(keys, key)]
+                tree.join(other)
+            assert tree.check() and len(other) == 0
+            assert list(tree) == keys and len(tree) == len(keys)
+        # 批量建树, 建好后仍可正常增删
+        for size in list(range(10)) + [random.randint(10, 2000) for _ in range(20)]:
+            keys = [random.randint(0, 99) for _ in range(size)]
+            print(f'\t> from_sorted with {size} keys')
+            tree = RedBlackTree.from_sorted(keys, multiset)
+            keys.sort()
+            assert tree.check() and list(tree) == keys and len(tree) == size
+            for _ in range(size // 2):
+                key = random.randint(0, 99)
+                tree.insert(key)
+                bisect.insort(keys, key)
+                index = random.randint(0, size - 1)
+                tree.delete_by_index(index)
+                keys.pop(index)
+            assert tree.check() and list(tree) == keys
     print('===== 正确性测试通过 =====')
     print()
-    print('===== 性能测试 =====')
-    k_list = list(range(1, 21, 1))
-    time_cost = pd.DataFrame(
-        index=pd.Index(data=[f'2^{k}' for k in k_list], name='n=2^k'),
-        columns=pd.Index(['total insert cost', 'total delete cost',
-                          'insert cost / lg(n)', 'delete cost / lg(n)']),
+    print('===== 内存测试 =====')
+    n = 2 ** 16
+    keys = [random.randint(0, 999) for _ in range(n)]
+    for multiset in (False, True):
+        tree = RedBlackTree(multiset)
+        tracemalloc.start()
+        for key in keys:
+            tree.insert(key)
+        print(f'multiset={multiset}, n=2^16, memory per key = {tracemalloc.get_traced_memory()[0] / n:.2f} B')
+        tracemalloc.stop()
+    print('===== 内存测试结束 =====')
+    print()
+    print('===== 批量建树测试 =====')
+    gc.disable()
+    bulk_list = [10, 14, 18, 20]
+    bulk_cost = pd.DataFrame(
+        index=pd.Index(data=[f'2^{k}' for k in bulk_list], name='n=2^k'),
+        columns=pd.Index(['insert one by one', 'from_sorted (sorted)', 'from_sorted (unsorted)']),
         dtype=float
     )
-    gc.disable()  # 避免 gc 造成性能波动
-    tree.clear()
-    last_n = 0
-    for k in k_list:
-        n = 2 ** k
-        delta = n - last_n
-        last_n = n
-        for _ in range(delta):
-            tree.insert(random.randint(0, 999))
-        insert_sum_time = 0
-        delete_sum_time = 0
-        repeat_times = 10000
-        for _ in range(repeat_times):
-            key = random.randint(0, 999)
-            start = time.time()
+    for k in bulk_list:
+        keys = [random.randint(0, 999) for _ in range(2 ** k)]
+        sorted_keys = sorted(keys)
+        tree = RedBlackTree()
+        start = time.time()
+        for key in keys:
             tree.insert(key)
-            end = time.time()
-            insert_sum_time += end - start
-            start = time.time()
-            tree.delete(key)
-            end = time.time()
-            delete_sum_time += end - start
-        print(f'n=2^{k}\n\tinsert cost sum = {insert_sum_time} s\n\tdelete cost sum = {delete_sum_time} s')
-        time_cost.loc[f'2^{k}', 'total insert cost'] = insert_sum_time
-        time_cost.loc[f'2^{k}', 'total delete cost'] = delete_sum_time
-        time_cost.loc[f'2^{k}', 'insert cost / lg(n)'] = insert_sum_time / k * 100
-        time_cost.loc[f'2^{k}', 'delete cost / lg(n)'] = delete_sum_time / k * 100
-    print(time_cost)
+        end = time.time()
+        bulk_cost.loc[f'2^{k}', 'insert one by one'] = end - start
+        start = time.time()
+        tree = RedBlackTree.from_sorted(sorted_keys)
+        end = time.time()
+        bulk_cost.loc[f'2^{k}', 'from_sorted (sorted)'] = end - start
+        start = time.time()
+        tree = RedBlackTree.from_sorted(keys)
+        end = time.time()
+        bulk_cost.loc[f'2^{k}', 'from_sorted (unsorted)'] = end - start
+    print(bulk_cost)
+    gc.enable()
+    gc.collect()
+    print('===== 批量建树测试结束 =====')
+    print()
+    for multiset in (True, False):  # 最后留下普通模式的树, 供后面的测试使用
+        print(f'===== 性能测试 (multiset={multiset}) =====')
+        k_list = list(range(1, 21, 1))
+        time_cost = pd.DataFrame(
+            index=pd.Index(data=[f'2^{k}' for k in k_list], name='n=2^k'),
+            columns=pd.Index(['total insert cost', 'total delete cost', 'total select cost',
+                              'total delete_by_index cost', 'insert cost / lg(n)', 'delete cost / lg(n)',
+                              'select cost / lg(n)', 'delete_by_index cost / lg(n)']),
+            dtype=float
+        )
+        # 普通模式下同时对比 B+ 树与有序列表上的 bisect, 三者存放同样的 key
+        engine_list = ['RB tree', 'B+ tree', 'bisect']
+        engine_cost = pd.DataFrame(
+            index=pd.Index(data=[f'2^{k}' for k in k_list], name='n=2^k'),
+            columns=pd.MultiIndex.from_product([['insert', 'delete', 'lookup', 'range'], engine_list]),
+            dtype=float
+        )
+        bplus_tree = BPlusTree()
+        sorted_keys = []
+
+        def bisect_delete(key):
+            index = bisect.bisect_left(sorted_keys, key)
+            if index < len(sorted_keys) and sorted_keys[index] == key:
+                del sorted_keys[index]
+
+        def bisect_lookup(key) -> bool:
+            index = bisect.bisect_left(sorted_keys, key)
+            return index < len(sorted_keys) and sorted_keys[index] == key
+
+        def bisect_scan(key) -> list:
+            index = bisect.bisect_left(sorted_keys, key)
+            return sorted_keys[index:index + 100]
+
+        gc.disable()  # 避免 gc 造成性能波动
+        tree = RedBlackTree(multiset)
+        last_n = 0
+        for k in k_list:
+            n = 2 ** k
+            delta = n - last_n
+            last_n = n
+            new_keys = [random.randint(0, 999) for _ in range(delta)]
+            tree = RedBlackTree.from_sorted(itertools.chain(tree, new_keys), multiset)  # 批量重建, O(n)
+            if not multiset:
+                for key in new_keys:
+                    bplus_tree.insert(key)
+                sorted_keys = sorted(sorted_keys + new_keys)
+            insert_sum_time = 0
+            delete_sum_time = 0
+            select_sum_time = 0
+            delete_by_index_sum_time = 0
+            repeat_times = 10000
+            for _ in range(repeat_times):
+                key = random.randint(0, 999)
+                start = time.time()
+                tree.insert(key)
+                end = time.time()
+                insert_sum_time += end - start
+                start = time.time()
+                tree.delete(key)
+                end = time.time()
+                delete_sum_time += end - start
+                index = random.randint(0, n - 1)
+                start = time.time()
+                tree.select(index)
+                end = time.time()
+                select_sum_time += end - start
+                start = time.time()
+                tree.delete_by_index(index)
+                end = time.time()
+                delete_by_index_sum_time += end - start
+                tree.insert(random.randint(0, 999))  # 保持结点数不变
+            print(f'n=2^{k}\n\tinsert cost sum = {insert_sum_time} s\n\tdelete cost sum = {delete_sum_time} s'
+                  f'\n\tselect cost sum = {select_sum_time} s\n\tdelete_by_index cost sum = {delete_by_index_sum_time} s')
+            time_cost.loc[f'2^{k}', 'total insert cost'] = insert_sum_time
+            time_cost.loc[f'2^{k}', 'total delete cost'] = delete_sum_time
+            time_cost.loc[f'2^{k}', 'insert cost / lg(n)'] = insert_sum_time / k * 100
+            time_cost.loc[f'2^{k}', 'delete cost / lg(n)'] = delete_sum_time / k * 100
+            time_cost.loc[f'2^{k}', 'total select cost'] = select_sum_time
+            time_cost.loc[f'2^{k}', 'total delete_by_index cost'] = delete_by_index_sum_time
+            time_cost.loc[f'2^{k}', 'select cost / lg(n)'] = select_sum_time / k * 100
+            time_cost.loc[f'2^{k}', 'delete_by_index cost / lg(n)'] = delete_by_index_sum_time / k * 100
+            if multiset:
+                continue
+            keys = [random.randint(0, 999) for _ in range(repeat_times)]
+            # 区间扫描: 从第一个不小于 key 的位置起取 100 个 key
+            engines = [
+                ('RB tree', tree.insert, tree.delete, tree.find,
+                 lambda key: list(itertools.islice(tree.range(key), 100))),
+                ('B+ tree', bplus_tree.insert, bplus_tree.delete, bplus_tree.get,
+                 lambda key: list(itertools.islice(bplus_tree.range(key), 100))),
+                ('bisect', lambda key: bisect.insort(sorted_keys, key), bisect_delete, bisect_lookup,
+                 bisect_scan),
+            ]
+            for engine, insert, delete, lookup, scan in engines:
+                start = time.time()
+                for key in keys:
+                    insert(key)
+                end = time.time()
+                engine_cost.loc[f'2^{k}', ('insert', engine)] = end - start
+                start = time.time()
+                for key in keys:
+                    lookup(key)
+                end = time.time()
+                engine_cost.loc[f'2^{k}', ('lookup', engine)] = end - start
+                start = time.time()
+                for key in keys:
+                    scan(key)
+                end = time.time()
+                engine_cost.loc[f'2^{k}', ('range', engine)] = end - start
+                start = time.time()
+                for key in keys:
+                    delete(key)
+                end = time.time()
+                engine_cost.loc[f'2^{k}', ('delete', engine)] = end - start
+        print(time_cost)
+        if not multiset:
+            print(engine_cost)
+        gc.enable()
+        gc.collect()
+        print('===== 性能测试结束 =====')
+        print()
+    print('===== 遍历测试 =====')
+    # 迭代器逐个产生 key, 峰值内存与 n 无关
+    tracemalloc.start()
+    start = time.time()
+    count = sum(1 for _ in tree)
+    end = time.time()
+    print(f'n={count}, iterate cost = {end - start} s, peak memory = {tracemalloc.get_traced_memory()[1]} B')
+    tracemalloc.stop()
+    lo = random.randint(0, 999)
+    start = time.time()
+    count = sum(1 for _ in tree.range(lo, lo + 100))
+    end = time.time()
+    print(f'range [{lo}, {lo + 100}): {count} keys, cost = {end - start} s')
+    print('===== 遍历测试结束 =====')
+    print()
+    print('===== 集合运算测试 =====')
+    # 把 m 个 key 并入 n 个结点的树, 与逐个 insert 比较
+    gc.disable()
+    m_list = [4, 8, 12, 16, 20]
+    union_cost = pd.DataFrame(
+        index=pd.Index(data=[f'2^{k}' for k in m_list], name='m=2^k'),
+        columns=pd.Index(['n', 'insert one by one', 'union']),
+        dtype=float
+    )
+    for k in m_list:
+        m = 2 ** k
+        other = RedBlackTree()
+        for _ in range(m):
+            other.insert(random.randint(0, 999))
+        union_cost.loc[f'2^{k}', 'n'] = len(tree)
+        start = time.time()
+        tree.union(other)
+        end = time.time()
+        union_cost.loc[f'2^{k}', 'union'] = end - start
+        start = time.time()
+        for _ in range(m):
+            tree.insert(random.randint(0, 999))
+        end = time.time()
+        union_cost.loc[f'2^{k}', 'insert one by one'] = end - start
+    print(union_cost)
+    start = time.time()
+    for _ in range(1000):
+        tree.join(tree.split(random.randint(0, 999)))
+    end = time.time()
+    print(f'split + join cost = {(end - start) / 1000} s')
     gc.enable()
     gc.collect()
-    print('===== 性能测试结束 =====')
+    print('===== 集合运算测试结束 =====')